@@ -7,15 +7,37 @@ import os
 import logging
 import requests
 import json
-from typing import Dict, Any, Optional
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional, Tuple
 
 # Importation des classes de logique métier
-from handlers import TelegramHandlers
+from handlers import TelegramHandlers, HTTP_TIMEOUT, _loads
 from card_predictor import CardPredictor 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Types d'updates traités par les handlers (setWebhook et getUpdates) : Telegram n'envoie pas les autres
+ALLOWED_UPDATES = ['message', 'edited_message', 'channel_post', 'edited_channel_post', 'callback_query', 'my_chat_member']
+_ALLOWED_UPDATES_PARAM = json.dumps(ALLOWED_UPDATES)  # paramètre de requête GET : tableau JSON
+
+# File des updates traités hors du thread appelant (requête webhook ou boucle de polling) par un
+# consommateur unique ; bornée : au-delà, le polling attend et le webhook fait renvoyer l'update
+UPDATE_QUEUE_MAX = 1024
+
+# Libellé de log par type d'update (premier type présent dans l'update)
+_UPDATE_LOG_MESSAGES = {
+    'message': "🔄 Bot traite message normal/post canal via webhook",
+    'channel_post': "🔄 Bot traite message normal/post canal via webhook",
+    'edited_message': "🔄 Bot traite message édité/post édité via webhook",
+    'edited_channel_post': "🔄 Bot traite message édité/post édité via webhook",
+    'my_chat_member': "🔄 Bot traite événement d'adhésion au chat (my_chat_member)",
+    'callback_query': "🔄 Bot traite clic de bouton (callback_query)",
+}
+
 class TelegramBot:
     """
     Classe de haut niveau pour gérer les interactions avec l'API Telegram
@@ -25,6 +47,12 @@ class TelegramBot:
     def __init__(self, token: str):
         self.token = token
         self.base_url = f"https://api.telegram.org/bot{token}"
+        # URLs des méthodes Bot API construites une seule fois (getUpdates est appelé en boucle en mode polling)
+        self._get_updates_url = f"{self.base_url}/getUpdates"
+        self._delete_webhook_url = f"{self.base_url}/deleteWebhook"
+        self._set_webhook_url = f"{self.base_url}/setWebhook"
+        self._send_document_url = f"{self.base_url}/sendDocument"
+        self._get_me_url = f"{self.base_url}/getMe"
         self.deployment_file_path = "final2025.zip" 
         
         # Initialize advanced handlers
@@ -33,29 +61,83 @@ class TelegramBot:
         if not self.handlers.card_predictor:
             logger.error("🚨 Le moteur de prédiction n'a pas pu être initialisé.")
 
+        # Thread de traitement démarré au premier update (dans le processus worker, pas au chargement)
+        # Éléments : (update, Future de la réponse au webhook pour une commande, sinon None)
+        self._update_queue: "queue.Queue[Tuple[Dict[str, Any], Optional[Future]]]" = queue.Queue(maxsize=UPDATE_QUEUE_MAX)
+        self._update_worker: Optional[threading.Thread] = None
+        self._update_worker_lock = threading.Lock()
+
+    @staticmethod
+    def needs_webhook_reply(update: Dict[str, Any]) -> bool:
+        """Commande (/...) : le webhook attend son traitement pour renvoyer la réponse dans son corps."""
+        message = update.get('message') or update.get('channel_post')
+        if not message:
+            return False
+        text = message.get('text') or ''
+        # Cas courant sans copie de la chaîne ; lstrip() seulement si le texte commence par un blanc
+        return text[:1] == '/' or (text[:1].isspace() and text.lstrip()[:1] == '/')
+
+    def submit_update(self, update: Dict[str, Any], block: bool = True, reply: Optional[Future] = None) -> bool:
+        """
+        Met l'update en file pour le thread de traitement ; False si la file est pleine (block=False).
+        Avec reply, la réponse à la commande (corps du webhook) y est déposée ; si reply est annulé
+        avant le traitement, la commande répond par l'API.
+        """
+        if self._update_worker is None:
+            with self._update_worker_lock:
+                if self._update_worker is None:
+                    self._update_worker = threading.Thread(target=self._process_updates, name="updates", daemon=True)
+                    self._update_worker.start()
+        try:
+            self._update_queue.put((update, reply), block=block)
+            return True
+        except queue.Full:
+            return False
 
-    def handle_update(self, update: Dict[str, Any]) -> None:
-        """Handle incoming Telegram update with advanced features for webhook mode"""
+    def _process_updates(self) -> None:
+        """Traite les updates de la file dans l'ordre, sur un seul thread."""
+        predictor = self.handlers.card_predictor
+        # Verrou du prédicteur : la sauvegarde programmée (thread minuteur) attend la fin de l'update
+        lock = predictor.lock if predictor is not None else nullcontext()
+        while True:
+            update, reply = self._update_queue.get()
+            webhook_reply = reply is not None and reply.set_running_or_notify_cancel()
+            # handle_update journalise lui-même ses erreurs
+            with lock:
+                result = self.handle_update(update, webhook_reply=webhook_reply)
+            if webhook_reply:
+                reply.set_result(result)
+
+
+    def send_reply_when_done(self, reply: Future) -> None:
+        """Commande que le webhook n'attend plus : sa réponse part par l'API dès la fin du traitement."""
+        reply.add_done_callback(self._send_abandoned_reply)
+
+    def _send_abandoned_reply(self, reply: Future) -> None:
+        # handle_update ne lève pas : le résultat est la réponse préparée, ou None
+        payload = reply.result()
+        if payload:
+            self.handlers.send_webhook_reply(payload)
+
+    def handle_update(self, update: Dict[str, Any], webhook_reply: bool = False) -> Optional[Dict[str, Any]]:
+        """Handle incoming Telegram update; returns the Bot API call to answer the webhook with, if any"""
         try:
-            # Log de haut niveau pour les différents types d'updates
-            if 'message' in update or 'channel_post' in update:
-                logger.info(f"🔄 Bot traite message normal/post canal via webhook")
-            elif 'edited_message' in update or 'edited_channel_post' in update:
-                logger.info(f"🔄 Bot traite message édité/post édité via webhook")
-            elif 'my_chat_member' in update:
-                 logger.info(f"🔄 Bot traite événement d'adhésion au chat (my_chat_member)")
-            elif 'callback_query' in update:
-                 logger.info(f"🔄 Bot traite clic de bouton (callback_query)")
-
-            logger.debug(f"Received update: {json.dumps(update, indent=2)}")
+            # Diagnostic (type d'update, contenu) : aucun travail si le niveau DEBUG est inactif
+            if logger.isEnabledFor(logging.DEBUG):
+                update_kind = next((key for key in _UPDATE_LOG_MESSAGES if key in update), None)
+                if update_kind:
+                    logger.debug(_UPDATE_LOG_MESSAGES[update_kind])
+                logger.debug("Received update: %s", json.dumps(update, indent=2))
 
             # Délégation du traitement complet aux handlers
-            self.handlers.handle_update(update)
+            reply = self.handlers.handle_update(update, webhook_reply=webhook_reply)
             
-            logger.info(f"✅ Update traité avec succès via webhook")
+            logger.debug("✅ Update traité avec succès via webhook")
+            return reply
 
         except Exception as e:
-            logger.error(f"❌ Error handling update via webhook: {e}")
+            logger.error("❌ Error handling update via webhook: %s", e, exc_info=True)
+            return None
 
     # --- Méthodes API Directes (Pour setWebhook et autres) ---
 
@@ -67,10 +149,10 @@ class TelegramBot:
     def send_document(self, chat_id: int, file_path: str) -> bool:
         """Send document file to user (Méthode incluse pour respecter le schéma)"""
         try:
-            url = f"{self.base_url}/sendDocument"
+            url = self._send_document_url
 
             if not os.path.exists(file_path):
-                logger.error(f"File not found for sending: {file_path}")
+                logger.error("File not found for sending: %s", file_path)
                 return False
 
             with open(file_path, 'rb') as file:
@@ -82,46 +164,71 @@ class TelegramBot:
                     'caption': '📦 Deployment Package for render.com'
                 }
 
-                response = requests.post(url, data=data, files=files, timeout=60)
+                response = self.handlers.session.post(url, data=data, files=files, timeout=60)
                 return response.json().get('ok', False)
         except Exception as e:
-            logger.error(f"Error sending document: {e}")
+            logger.error("Error sending document: %s", e)
             return False
 
     def set_webhook(self, webhook_url: str) -> bool:
         """Set webhook URL for the bot"""
         try:
-            url = f"{self.base_url}/setWebhook"
+            url = self._set_webhook_url
             # MISE À JOUR CRITIQUE: Inclure 'callback_query' et 'my_chat_member'
             data = {
                 'url': webhook_url,
-                'allowed_updates': ['message', 'edited_message', 'channel_post', 'edited_channel_post', 'callback_query', 'my_chat_member']
+                'allowed_updates': ALLOWED_UPDATES
             }
 
-            response = requests.post(url, json=data, timeout=10)
+            response = self.handlers.session.post(url, json=data, timeout=10)
             result = response.json()
             if result.get('ok'):
-                logger.info(f"Webhook set successfully: {webhook_url}")
+                logger.info("Webhook set successfully: %s", webhook_url)
                 return True
             else:
-                logger.error(f"Failed to set webhook: {result}")
+                logger.error("Failed to set webhook: %s", result)
                 return False
 
         except requests.exceptions.RequestException as e:
-            logger.error(f"Network error setting webhook: {e}")
+            logger.error("Network error setting webhook: %s", e)
             return False
         except Exception as e:
-            logger.error(f"Error setting webhook: {e}")
+            logger.error("Error setting webhook: %s", e)
+            return False
+
+    def get_updates(self, offset: int = 0, timeout: int = 30) -> List[Dict[str, Any]]:
+        """Long polling getUpdates (mode polling) ; lève requests.exceptions.RequestException en cas d'échec"""
+        params = {'offset': offset, 'timeout': timeout, 'allowed_updates': _ALLOWED_UPDATES_PARAM}
+        # Délai de lecture supérieur au long polling : Telegram garde la requête ouverte jusqu'à `timeout`
+        response = self.handlers.session.get(self._get_updates_url, params=params, timeout=(HTTP_TIMEOUT[0], timeout + HTTP_TIMEOUT[1]))
+        try:
+            result = _loads(response.content)
+        except ValueError as e:
+            # Corps non JSON (502, page d'erreur d'un proxy) : traité comme une erreur HTTP par la boucle de polling
+            raise requests.exceptions.HTTPError(f"getUpdates: réponse invalide (HTTP {response.status_code}): {e}", response=response) from e
+        if not result.get('ok'):
+            # Réponse d'erreur de l'API (ex. 429 avec parameters.retry_after) : la boucle de polling décide du délai
+            raise requests.exceptions.HTTPError(f"getUpdates: {result.get('description')}", response=response)
+        return result.get('result', [])
+
+    def delete_webhook(self) -> bool:
+        """Delete webhook (required before getUpdates)"""
+        try:
+            url = self._delete_webhook_url
+            response = self.handlers.session.post(url, timeout=HTTP_TIMEOUT)
+            return response.json().get('ok', False)
+        except Exception as e:
+            logger.error("Error deleting webhook: %s", e)
             return False
 
     def get_bot_info(self) -> Dict[str, Any]:
         """Get bot information"""
         try:
-            url = f"{self.base_url}/getMe"
-            response = requests.get(url, timeout=30)
+            url = self._get_me_url
+            response = self.handlers.session.get(url, timeout=30)
             result = response.json()
             return result.get('result', {}) if result.get('ok') else {}
         except Exception as e:
-            logger.error(f"Error getting bot info: {e}")
+            logger.error("Error getting bot info: %s", e)
             return {}
             
@@ -6,10 +6,16 @@ Card prediction logic for Joker's Telegram Bot - simplified for webhook deployme
 import re
 import logging
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Tuple, Any
+from typing import Optional, Dict, List, Tuple, Any, Set, TypedDict
+from collections import Counter, OrderedDict, deque
 import time
 import os
 import json
+import sys
+import atexit
+import threading
+from dataclasses import dataclass, asdict, fields
+from enum import IntEnum
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -18,30 +24,145 @@ logger.setLevel(logging.INFO)
 HIGH_VALUE_CARDS = ["A", "K", "Q", "J"] 
 CARD_SYMBOLS = [r"♠️", r"♥️", r"♦️", r"♣️", r"❤️"] # Inclure les deux variantes pour le pattern regex
 
+# --- EXPRESSIONS RÉGULIÈRES PRÉCOMPILÉES (appelées à chaque message du canal) ---
+_GAME_NUMBER_RE = re.compile(r'#N(\d+)\.', re.IGNORECASE)
+_PREDICTION_NUMBER_RE = re.compile(r'🔵(\d+)🔵')
+_PARENTHESES_RE = re.compile(r'\(([^)]*)\)')
+_CARD_RE = re.compile(r'(\d+|[AKQJ])(♠️|♥️|♦️|♣️)', re.IGNORECASE)
+_CARD_VALUE_RE = re.compile(r'(\d+|[AKQJ])')
+# Dame suivie d'un symbole de couleur, sélecteur de variante (U+FE0F) facultatif
+_DAME_RE = re.compile(r'Q[\u2665\u2660\u2666\u2663\u2764]\uFE0F?', re.IGNORECASE)
+
+# Statut affiché selon le décalage de la Dame trouvée (N, N+1, N+2) ; ❌ pour l'échec final
+_STATUS_SYMBOLS = {0: "✅0️⃣", 1: "✅1️⃣", 2: "✅2️⃣"}
+
+class Status(IntEnum):
+    """Statut d'une prédiction (persisté en entier dans predictions.json)."""
+    PENDING = 0
+    CORRECT_0 = 1
+    CORRECT_1 = 2
+    CORRECT_2 = 3
+    FAILED = 4
+
+# Succès selon le décalage de la Dame trouvée
+_CORRECT_BY_OFFSET = (Status.CORRECT_0, Status.CORRECT_1, Status.CORRECT_2)
+# Anciens statuts texte, convertis au chargement
+_LEGACY_STATUS = {
+    'pending': Status.PENDING,
+    'correct_offset_0': Status.CORRECT_0,
+    'correct_offset_1': Status.CORRECT_1,
+    'correct_offset_2': Status.CORRECT_2,
+    'failed': Status.FAILED,
+}
+
+# Nombre maximal de messages traités mémorisés (les plus anciens sont oubliés)
+PROCESSED_MAX = 10000
+
+# Durée (secondes) pendant laquelle le message /inter déjà construit est réutilisé
+INTER_STATUS_CACHE_SECONDS = 2.0
+
+# --- PERSISTANCE DIFFÉRÉE ---
+FLUSH_INTERVAL = 1.0  # délai (secondes) avant l'écriture groupée des modifications d'une rafale
+# Fichier persisté -> état à sérialiser
+_PERSISTED_FILES = {
+    'predictions.json': lambda cp: {game: record.to_dict() for game, record in cp.predictions.items()},
+    'processed.json': lambda cp: list(cp._processed_order),
+    'last_prediction_time.json': lambda cp: cp.last_prediction_time,
+    'inter_data.json': lambda cp: cp.inter_data,
+    'sequential_history.json': lambda cp: cp.sequential_history,
+    'inter_mode_status.json': lambda cp: cp.is_inter_mode_active,
+    'smart_rules.json': lambda cp: cp.smart_rules,
+}
+
+# --- STRUCTURES DES ENREGISTREMENTS (modifiés sur place, persistés en JSON) ---
+class SequentialEntry(TypedDict):
+    """Deux premières cartes d'un jeu, en attente d'une Dame à N+2."""
+    cartes: List[str]
+    date: str
+
+class InterEntry(TypedDict):
+    """Déclencheur N-2 relié à une Dame (Q) trouvée à N."""
+    numero_resultat: int
+    declencheur: List[str]
+    numero_declencheur: int
+    carte_q: str
+    date_resultat: str
+
+@dataclass(slots=True)
+class PredictionRecord:
+    """Prédiction publiée et son état de vérification."""
+    predicted_costume: str
+    status: Status
+    predicted_from: int
+    verification_count: int
+    message_text: str
+    message_id: Optional[int] = None
+    final_message: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'PredictionRecord':
+        # Les clés inconnues d'anciens fichiers sont ignorées
+        record = cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+        status = record.status
+        record.status = _LEGACY_STATUS[status] if isinstance(status, str) else Status(status)
+        return record
+
 class CardPredictor:
     """Gère la logique de prédiction de carte Dame (Q) et la vérification."""
 
     def __init__(self):
         # Données de persistance (Prédictions et messages)
-        self.predictions = self._load_data('predictions.json') 
-        self.processed_messages = self._load_data('processed.json', is_set=True) 
+        self.predictions: Dict[int, PredictionRecord] = {
+            int(game): PredictionRecord.from_dict(data)
+            for game, data in self._load_data('predictions.json').items()
+        }
+        # Nombre de prédictions par statut, tenu à jour à chaque changement (/stat et /bilan en O(1))
+        self._status_counts: Counter = Counter(p.status for p in self.predictions.values())
+        # Fenêtre bornée des messages traités (ordre d'ajout) + ensemble miroir pour l'appartenance en O(1)
+        # Liste chargée telle qu'écrite (plus anciens d'abord) : l'éviction par la tête reste chronologique après un redémarrage
+        self._processed_order: deque = deque(self._load_data('processed.json') or [], maxlen=PROCESSED_MAX)
+        self.processed_messages: Set[int] = set(self._processed_order)
         self.last_prediction_time = self._load_data('last_prediction_time.json', is_scalar=True)
         
         # Configuration dynamique des canaux
         self.config_data = self._load_data('channels_config.json')
-        self.target_channel_id = self.config_data.get('target_channel_id', None)
-        self.prediction_channel_id = self.config_data.get('prediction_channel_id', None)
+        # Entiers dès le chargement : comparés directement aux chat_id des updates
+        self.target_channel_id = self._parse_channel_id(self.config_data.get('target_channel_id'))
+        self.prediction_channel_id = self._parse_channel_id(self.config_data.get('prediction_channel_id'))
         
         # --- Logique INTER (N-2 -> Q à N) ---
         # Stocke les cartes de tous les jeux, en attendant que Q arrive à N pour relier à N-2
-        self.sequential_history: Dict[int, Dict] = self._load_data('sequential_history.json') 
+        # (ordonné par numéro de jeu : la purge retire les plus anciens par la tête)
+        self.sequential_history: Dict[int, SequentialEntry] = OrderedDict(sorted(self._load_data('sequential_history.json').items()))
         # Données officielles des déclencheurs
-        self.inter_data: List[Dict] = self._load_data('inter_data.json') 
+        self.inter_data: List[InterEntry] = self._load_data('inter_data.json') 
+        # Index des jeux résultats (Q à N) déjà enregistrés : anti-doublon sans parcourir inter_data
+        self._dame_games: Set[int] = {entry.get('numero_resultat') for entry in self.inter_data}
+
+        # Cartes internées : quelques dizaines de valeurs possibles, partagées par tous les enregistrements
+        for entry in self.sequential_history.values():
+            entry['cartes'] = [sys.intern(card) for card in entry['cartes']]
+        for entry in self.inter_data:
+            entry['declencheur'] = [sys.intern(card) for card in entry['declencheur']]
         
         # Statut et Règles
         self.is_inter_mode_active = self._load_data('inter_mode_status.json', is_scalar=True)
         self.smart_rules = self._load_data('smart_rules.json') # Stocke les Top 3 actifs
         self.prediction_cooldown = 30 
+
+        # Dernier statut /inter construit : (instant, état source, texte, clavier)
+        self._last_inter_message: Optional[Tuple[float, Tuple, str, Optional[Dict]]] = None
+
+        # Fichiers modifiés en attente d'écriture (vidés par flush, et à l'arrêt du processus)
+        self._dirty: Set[str] = set()
+        # Écriture programmée par la première modification d'une rafale (thread minuteur) ;
+        # le thread qui modifie l'état tient self.lock pour que la sauvegarde voie un état cohérent
+        self._flush_timer: Optional[threading.Timer] = None
+        self.lock = threading.RLock()
+        atexit.register(self.flush)
         
         if self.inter_data and not self.is_inter_mode_active:
              self.analyze_and_set_smart_rules(initial_load=True) # Analyse à l'initialisation si l'historique existe
@@ -68,7 +189,7 @@ class CardPredictor:
                 
                 return data
         except (FileNotFoundError, json.JSONDecodeError):
-            logger.warning(f"⚠️ Fichier {filename} non trouvé ou vide. Initialisation par défaut.")
+            logger.warning("⚠️ Fichier %s non trouvé ou vide. Initialisation par défaut.", filename)
             if is_set: return set()
             if is_scalar and filename == 'inter_mode_status.json': return False
             if is_scalar: return 0.0
@@ -77,7 +198,7 @@ class CardPredictor:
             if filename == 'smart_rules.json': return []
             return {}
         except Exception as e:
-             logger.error(f"❌ Erreur critique de chargement de {filename}: {e}")
+             logger.error("❌ Erreur critique de chargement de %s: %s", filename, e)
              return set() if is_set else (False if filename == 'inter_mode_status.json' else ([] if filename == 'inter_data.json' else {}))
 
     def _save_data(self, data: Any, filename: str):
@@ -93,17 +214,41 @@ class CardPredictor:
             with open(filename, 'w') as f:
                 json.dump(data_to_save, f, indent=4)
         except Exception as e:
-            logger.error(f"❌ Erreur critique de sauvegarde de {filename}: {e}. Problème de permissions ou de disque.")
+            logger.error("❌ Erreur critique de sauvegarde de %s: %s. Problème de permissions ou de disque.", filename, e)
 
     def _save_all_data(self):
         """Sauvegarde tous les états persistants."""
-        self._save_data(self.predictions, 'predictions.json')
-        self._save_data(self.processed_messages, 'processed.json')
-        self._save_data(self.last_prediction_time, 'last_prediction_time.json')
-        self._save_data(self.inter_data, 'inter_data.json')
-        self._save_data(self.sequential_history, 'sequential_history.json')
-        self._save_data(self.is_inter_mode_active, 'inter_mode_status.json')
-        self._save_data(self.smart_rules, 'smart_rules.json')
+        self._dirty.clear()
+        for filename, get in _PERSISTED_FILES.items():
+            self._save_data(get(self), filename)
+
+    def _mark_dirty(self, *files: str):
+        """Marque des fichiers à sauvegarder ; les écritures d'une rafale sont regroupées."""
+        with self.lock:
+            self._dirty.update(files)
+            if self._flush_timer is None:
+                # Sans nouvel événement, les dernières modifications sont écrites au plus tard après FLUSH_INTERVAL
+                self._flush_timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self):
+        """Écrit uniquement les fichiers marqués depuis la dernière sauvegarde."""
+        with self.lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            dirty, self._dirty = self._dirty, set()
+            for filename in dirty:
+                self._save_data(_PERSISTED_FILES[filename](self), filename)
+
+    @staticmethod
+    def _parse_channel_id(value: Any) -> Optional[int]:
+        """ID de canal lu dans channels_config.json en entier (None si absent ou invalide)."""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
 
     def _save_channels_config(self):
         """Sauvegarde les IDs de canaux dans channels_config.json."""
@@ -115,10 +260,10 @@ class CardPredictor:
         """Met à jour les IDs de canal et sauvegarde."""
         if channel_type == 'source':
             self.target_channel_id = channel_id
-            logger.info(f"💾 Canal SOURCE mis à jour: {channel_id}")
+            logger.info("💾 Canal SOURCE mis à jour: %s", channel_id)
         elif channel_type == 'prediction':
             self.prediction_channel_id = channel_id
-            logger.info(f"💾 Canal PRÉDICTION mis à jour: {channel_id}")
+            logger.info("💾 Canal PRÉDICTION mis à jour: %s", channel_id)
         else:
             return False
             
@@ -130,11 +275,11 @@ class CardPredictor:
         """Extrait le numéro du jeu, reconnaissant #N et #n."""
         
         # Recherche #N ou #n en ignorant la casse (re.IGNORECASE)
-        match = re.search(r'#N(\d+)\.', message, re.IGNORECASE) 
+        match = _GAME_NUMBER_RE.search(message) 
         
         if not match:
             # Recherche le format de prédiction (🔵N🔵)
-            match = re.search(r'🔵(\d+)🔵', message)
+            match = _PREDICTION_NUMBER_RE.search(message)
             
         if match:
             try:
@@ -145,8 +290,7 @@ class CardPredictor:
 
     def extract_first_parentheses_content(self, message: str) -> Optional[str]:
         """Extrait le contenu de la première parenthèse."""
-        pattern = r'\(([^)]*)\)' 
-        match = re.search(pattern, message)
+        match = _PARENTHESES_RE.search(message)
         if match:
             return match.group(1).strip()
         return None
@@ -155,9 +299,8 @@ class CardPredictor:
         """Extrait la valeur et le costume des cartes."""
         card_details = []
         normalized_content = content.replace("❤️", "♥️") # Normalise le cœur
-        # Pattern pour capturer la valeur (chiffre ou lettre) et le symbole
-        card_pattern = r'(\d+|[AKQJ])(♠️|♥️|♦️|♣️)'
-        matches = re.findall(card_pattern, normalized_content, re.IGNORECASE)
+        # Pattern précompilé : valeur (chiffre ou lettre) et symbole
+        matches = _CARD_RE.findall(normalized_content)
         for value, costume in matches:
             card_details.append((value.upper(), costume))
         return card_details
@@ -173,33 +316,61 @@ class CardPredictor:
         first_parentheses_content = self.extract_first_parentheses_content(message)
         if not first_parentheses_content:
             return None
+
+        # Pré-filtre : sans Dame dans le groupe, inutile d'extraire les cartes
+        if not _DAME_RE.search(first_parentheses_content):
+            return None
             
         card_details = self.extract_card_details(first_parentheses_content)
         
         for value, costume in card_details:
             if value == "Q":
-                logger.info(f"🔍 Détection Q: Dame (Q) trouvée dans le premier groupe: {value}{costume}")
+                logger.debug("🔍 Détection Q: Dame (Q) trouvée dans le premier groupe: %s%s", value, costume)
                 return (value, costume)
                 
         return None
 
+    def parse_message(self, message: str) -> Dict[str, Any]:
+        """
+        Analyse un message une seule fois (numéro, groupes, cartes, Dame) pour la vérification
+        et la prédiction, qui reçoivent ce résultat au lieu de ré-extraire le texte.
+        """
+        groups = _PARENTHESES_RE.findall(message)
+        first_group = groups[0].strip() if groups else None
+        first_cards = self.extract_card_details(first_group) if first_group else []
+        second_cards = self.extract_card_details(groups[1]) if len(groups) > 1 else []
+        return {
+            'game_number': self.extract_game_number(message),
+            'first_group': first_group,
+            'first_cards': first_cards,
+            'second_values': [v for v, c in second_cards],
+            'q_card': next(((v, c) for v, c in first_cards if v == "Q"), None),
+        }
+
     # --- Logique INTER (Mode Intelligent) - MISE À JOUR AVEC ANTI-DOUBLON ---
-    def collect_inter_data(self, game_number: int, message: str):
+    def collect_inter_data(self, game_number: int, message: str, parsed: Optional[Dict[str, Any]] = None):
         """Collecte les données (Déclencheur à N-2, Dame Q à N) selon la logique séquentielle."""
-        first_group_content = self.extract_first_parentheses_content(message)
-        if not first_group_content:
+        if parsed is None:
+            parsed = self.parse_message(message)
+        if not parsed['first_group']:
             return
 
         # 1. ENREGISTRER LE JEU ACTUEL DANS L'HISTORIQUE SÉQUENTIEL (N)
-        first_two_cards = self.get_first_two_cards(first_group_content)
+        history = self.sequential_history
+        first_two_cards = [sys.intern(f"{v}{c}") for v, c in parsed['first_cards'][:2]]
         if len(first_two_cards) == 2:
-            self.sequential_history[game_number] = {
+            is_out_of_order = game_number not in history and history and next(reversed(history)) > game_number
+            history[game_number] = {
                 'cartes': first_two_cards,
                 'date': datetime.now().isoformat()
             }
+            if is_out_of_order:
+                # Cas rare (jeu plus ancien reçu en retard) : on rétablit l'ordre des clés
+                self.sequential_history = history = OrderedDict(sorted(history.items()))
+            self._mark_dirty('sequential_history.json')
         
         # 2. VÉRIFIER SI CE JEU (N) EST LE RÉSULTAT (Dame Q)
-        q_card_details = self.check_value_Q_in_first_parentheses(message)
+        q_card_details = parsed['q_card']
         
         if q_card_details:
             # Si Dame Q trouvée à N, le déclencheur est N-2
@@ -212,13 +383,8 @@ class CardPredictor:
                 trigger_cards = trigger_entry['cartes']
                 
                 # --- VÉRIFICATION ANTI-DOUBLON ---
-                is_duplicate = any(
-                    entry.get('numero_resultat') == game_number 
-                    for entry in self.inter_data
-                )
-                
-                if is_duplicate:
-                    logger.warning(f"❌ INTER Data Ignoré: Doublon détecté pour le numéro de résultat N={game_number}. Non ajouté à l'historique INTER.")
+                if game_number in self._dame_games:
+                    logger.warning("❌ INTER Data Ignoré: Doublon détecté pour le numéro de résultat N=%s. Non ajouté à l'historique INTER.", game_number)
                     return # Arrête le processus pour éviter l'enregistrement en double
                 # --------------------------------
 
@@ -230,32 +396,24 @@ class CardPredictor:
                     'date_resultat': datetime.now().isoformat()
                 }
                 self.inter_data.append(new_entry)
-                self._save_all_data() 
-                logger.info(f"💾 INTER Data Saved: Q à N={game_number} déclenché par N-2={n_minus_2_game} ({trigger_cards})")
+                self._dame_games.add(game_number)
+                self._mark_dirty('inter_data.json')
+                logger.info("💾 INTER Data Saved: Q à N=%s déclenché par N-2=%s (%s)", game_number, n_minus_2_game, trigger_cards)
         
         # 4. NETTOYAGE: Supprimer les entrées très anciennes (par exemple, plus de 50 jeux avant)
         obsolete_game_limit = game_number - 50 
-        self.sequential_history = {
-            num: entry for num, entry in self.sequential_history.items() if num >= obsolete_game_limit
-        }
+        while history and next(iter(history)) < obsolete_game_limit:
+            history.popitem(last=False)
 
 
     def analyze_and_set_smart_rules(self, initial_load: bool = False) -> List[str]:
         """Analyse l'historique et définit les 3 règles les plus fréquentes."""
-        declencheur_counts = {}
-        for data in self.inter_data:
-            declencheur_key = tuple(data['declencheur']) 
-            declencheur_counts[declencheur_key] = declencheur_counts.get(declencheur_key, 0) + 1
-
-        sorted_declencheurs = sorted(
-            declencheur_counts.items(), 
-            key=lambda item: item[1], 
-            reverse=True
-        )
+        # Comptage en une passe ; seul le top 3 est extrait (par tas) puis mis en forme
+        declencheur_counts = Counter(tuple(data['declencheur']) for data in self.inter_data)
 
         top_3 = [
             {'cards': list(declencheur), 'count': count} 
-            for declencheur, count in sorted_declencheurs[:3]
+            for declencheur, count in declencheur_counts.most_common(3)
         ]
         self.smart_rules = top_3
         
@@ -266,13 +424,19 @@ class CardPredictor:
             self.is_inter_mode_active = False 
 
         # Sauvegarder le statut et les règles
-        self._save_data(self.is_inter_mode_active, 'inter_mode_status.json')
-        self._save_data(self.smart_rules, 'smart_rules.json')
+        self._mark_dirty('inter_mode_status.json', 'smart_rules.json')
             
         return [f"{cards['cards'][0]} {cards['cards'][1]} (x{cards['count']})" for cards in top_3]
 
     def get_inter_status(self) -> Tuple[str, Optional[Dict]]:
         """Génère le statut pour la commande /inter avec l'historique et les boutons."""
+        # Rafales de /inter : réutilise le dernier message si rien n'a changé entre-temps
+        now = time.monotonic()
+        state = (len(self.inter_data), self.is_inter_mode_active, id(self.smart_rules), len(self.smart_rules))
+        cached = self._last_inter_message
+        if cached and cached[1] == state and now - cached[0] < INTER_STATUS_CACHE_SECONDS:
+            return cached[2], cached[3]
+
         status_lines = ["**📋 HISTORIQUE D'APPRENTISSAGE INTER 🧠**\n"]
         total_collected = len(self.inter_data) 
         
@@ -319,7 +483,9 @@ class CardPredictor:
             keyboard = None 
             status_lines.append("*Aucune action disponible. Attendez plus de données.*")
 
-        return "\n".join(status_lines), keyboard
+        message_text = "\n".join(status_lines)
+        self._last_inter_message = (now, state, message_text, keyboard)
+        return message_text, keyboard
 
     def can_make_prediction(self) -> bool:
         """Vérifie la période de refroidissement."""
@@ -343,17 +509,19 @@ class CardPredictor:
     # ----------------------------
 
     # (La suite de cette partie est dans la Partie 2)
-    def should_predict(self, message: str) -> Tuple[bool, Optional[int], Optional[str]]:
-        """Détermine si une prédiction doit être faite."""
+    def should_predict(self, message: str, parsed: Optional[Dict[str, Any]] = None) -> Tuple[bool, Optional[int], Optional[str]]:
+        """Détermine si une prédiction doit être faite (parsed : résultat de parse_message, si déjà calculé)."""
         if not self.target_channel_id:
              return False, None, None
              
-        game_number = self.extract_game_number(message)
+        if parsed is None:
+            parsed = self.parse_message(message)
+        game_number = parsed['game_number']
         if not game_number:
             return False, None, None
 
         # --- ÉTAPE CRITIQUE: Collecte de données pour INTER ---
-        self.collect_inter_data(game_number, message) 
+        self.collect_inter_data(game_number, message, parsed) 
         # ----------------------------------------------------
         
         # 1. BLOCAGE IMMEDIAT si le message est en attente (🕐/⏰)
@@ -362,34 +530,30 @@ class CardPredictor:
         
         # 2. VÉRIFICATION STRICTE DE FINALISATION (Doit avoir ✅ ou 🔰)
         if not self.has_completion_indicators(message):
-            logger.info("❌ PRÉDICTION BLOQUÉE: Message stable, mais sans indicateur de succès explicite (✅/🔰).")
+            logger.debug("❌ PRÉDICTION BLOQUÉE: Message stable, mais sans indicateur de succès explicite (✅/🔰).")
             return False, None, None
             
         predicted_value = None
-        first_group_content = self.extract_first_parentheses_content(message)
+        first_group_content = parsed['first_group']
 
         if first_group_content:
-            card_details = self.extract_card_details(first_group_content)
+            card_details = parsed['first_cards']
             card_values = [v for v, c in card_details]
             
-            # Extraction du second groupe pour les règles statiques 2 et 3
-            second_parentheses_pattern = r'\(([^)]*)\)'
-            all_matches = re.findall(second_parentheses_pattern, message)
-            second_group_content = all_matches[1] if len(all_matches) > 1 else ""
-            second_group_details = self.extract_card_details(second_group_content)
-            second_group_values = [v for v, c in second_group_details]
+            # Second groupe pour les règles statiques 2 et 3 (déjà extrait par parse_message)
+            second_group_values = parsed['second_values']
             
             
             # --- LOGIQUE DE PRÉDICTION ---
             
             # 1. LOGIQUE INTER (PRIORITÉ)
             if self.is_inter_mode_active and self.smart_rules:
-                current_trigger_cards = self.get_first_two_cards(first_group_content)
+                current_trigger_cards = [f"{v}{c}" for v, c in card_details[:2]]
                 current_trigger_tuple = tuple(current_trigger_cards)
                 
                 if any(tuple(rule['cards']) == current_trigger_tuple for rule in self.smart_rules):
                     predicted_value = "Q"
-                    logger.info(f"🔮 PRÉDICTION INTER: Déclencheur {current_trigger_cards} trouvé dans les règles intelligentes.")
+                    logger.info("🔮 PRÉDICTION INTER: Déclencheur %s trouvé dans les règles intelligentes.", current_trigger_cards)
             
             
             # 2. LOGIQUE STATIQUE (SEULEMENT SI INTER N'A PAS DÉJÀ PRÉDIT)
@@ -443,13 +607,13 @@ class CardPredictor:
                             previous_cards = previous_entry['cartes'] 
                             
                             # Extraire les valeurs (ex: '9', '7')
-                            previous_values = [re.match(r'(\d+|[AKQJ])', c).group(1) for c in previous_cards if re.match(r'(\d+|[AKQJ])', c)]
+                            previous_values = [m.group(1) for m in map(_CARD_VALUE_RE.match, previous_cards) if m]
                             
                             is_previous_g1_weak = not any(v in all_high_cards for v in previous_values)
                             
                             if is_previous_g1_weak:
                                 predicted_value = "Q"
-                                logger.info(f"🔮 PRÉDICTION STATIQUE 4: G1 faible consécutif détecté (Jeu {previous_game_number} et {game_number}).")
+                                logger.info("🔮 PRÉDICTION STATIQUE 4: G1 faible consécutif détecté (Jeu %s et %s).", previous_game_number, game_number)
 
         # ... (Fin de should_predict)
 
@@ -460,32 +624,63 @@ class CardPredictor:
         if predicted_value:
             message_hash = hash(message)
             if message_hash not in self.processed_messages:
-                self.processed_messages.add(message_hash)
+                self._add_processed(message_hash)
                 self.last_prediction_time = time.time()
-                self._save_all_data()
+                self._mark_dirty('processed.json', 'last_prediction_time.json')
                 return True, game_number, predicted_value
 
         return False, None, None
         
+    def _add_processed(self, key: int):
+        """Mémorise un message traité ; le plus ancien sort de la fenêtre (et de l'ensemble) quand elle est pleine."""
+        order = self._processed_order
+        if len(order) == order.maxlen:
+            self.processed_messages.discard(order[0])
+        order.append(key)
+        self.processed_messages.add(key)
+
+    def _set_status(self, prediction: PredictionRecord, status: Status):
+        """Change le statut d'une prédiction en maintenant les compteurs."""
+        self._status_counts[prediction.status] -= 1
+        self._status_counts[status] += 1
+        prediction.status = status
+
+    def get_counts(self) -> Dict[str, int]:
+        """Compteurs agrégés des prédictions (réussites par décalage, échecs, en attente)."""
+        c = self._status_counts
+        return {
+            'correct_0': c[Status.CORRECT_0],
+            'correct_1': c[Status.CORRECT_1],
+            'correct_2': c[Status.CORRECT_2],
+            'correct': c[Status.CORRECT_0] + c[Status.CORRECT_1] + c[Status.CORRECT_2],
+            'failed': c[Status.FAILED],
+            'pending': c[Status.PENDING],
+        }
+
     def make_prediction(self, game_number: int, predicted_value: str) -> str:
         """Génère le message de prédiction et l'enregistre."""
         target_game = game_number + 2
         prediction_text = f"🔵{target_game}🔵:Valeur Q statut :⏳"
 
-        self.predictions[target_game] = {
-            'predicted_costume': 'Q',
-            'status': 'pending',
-            'predicted_from': game_number,
-            'verification_count': 0,
-            'message_text': prediction_text,
-            'message_id': None 
-        }
-        self._save_all_data()
+        previous = self.predictions.get(target_game)
+        if previous is not None:
+            self._status_counts[previous.status] -= 1
+        self._status_counts[Status.PENDING] += 1
+        self.predictions[target_game] = PredictionRecord(
+            predicted_costume='Q',
+            status=Status.PENDING,
+            predicted_from=game_number,
+            verification_count=0,
+            message_text=prediction_text,
+        )
+        self._mark_dirty('predictions.json')
         return prediction_text
         
-    def _verify_prediction_common(self, text: str, is_edited: bool = False) -> Optional[Dict]:
+    def _verify_prediction_common(self, text: str, is_edited: bool = False, parsed: Optional[Dict[str, Any]] = None) -> Optional[Dict]:
         """Vérifie si le message contient le résultat pour une prédiction en attente (Q)."""
-        game_number = self.extract_game_number(text)
+        if parsed is None:
+            parsed = self.parse_message(text)
+        game_number = parsed['game_number']
         if not game_number or not self.predictions:
             return None
 
@@ -493,27 +688,26 @@ class CardPredictor:
         for predicted_game in sorted(self.predictions.keys()):
             prediction = self.predictions[predicted_game]
 
-            if prediction.get('status') != 'pending' or prediction.get('predicted_costume') != 'Q':
+            if prediction.status != Status.PENDING or prediction.predicted_costume != 'Q':
                 continue
 
             verification_offset = game_number - predicted_game
             
             # Vérification pour N, N+1, N+2 par rapport à la prédiction
             if 0 <= verification_offset <= 2:
-                status_symbol_map = {0: "✅0️⃣", 1: "✅1️⃣", 2: "✅2️⃣"}
-                q_found = self.check_value_Q_in_first_parentheses(text)
+                q_found = parsed['q_card']
                 
                 if q_found:
                     # SUCCÈS - Dame (Q) trouvée
-                    status_symbol = status_symbol_map[verification_offset]
+                    status_symbol = _STATUS_SYMBOLS[verification_offset]
                     updated_message = f"🔵{predicted_game}🔵:Valeur Q statut :{status_symbol}"
                     
-                    prediction['status'] = f'correct_offset_{verification_offset}'
-                    prediction['verification_count'] = verification_offset
-                    prediction['final_message'] = updated_message
-                    self._save_all_data()
+                    self._set_status(prediction, _CORRECT_BY_OFFSET[verification_offset])
+                    prediction.verification_count = verification_offset
+                    prediction.final_message = updated_message
+                    self._mark_dirty('predictions.json')
                     
-                    logger.info(f"🔍 ✅ SUCCÈS OFFSET +{verification_offset} - Dame (Q) trouvée au jeu {game_number}")
+                    logger.info("🔍 ✅ SUCCÈS OFFSET +%s - Dame (Q) trouvée au jeu %s", verification_offset, game_number)
                     
                     return {
                         'type': 'edit_message',
@@ -524,11 +718,11 @@ class CardPredictor:
                     # ÉCHEC à offset +2 - MARQUER ❌ (RIEN TROUVÉ)
                     updated_message = f"🔵{predicted_game}🔵:Valeur Q statut :❌"
 
-                    prediction['status'] = 'failed'
-                    prediction['final_message'] = updated_message
-                    self._save_all_data()
+                    self._set_status(prediction, Status.FAILED)
+                    prediction.final_message = updated_message
+                    self._mark_dirty('predictions.json')
                     
-                    logger.info(f"🔍 ❌ ÉCHEC OFFSET +2 - Rien trouvé, prédiction marquée: ❌")
+                    logger.info("🔍 ❌ ÉCHEC OFFSET +2 - Rien trouvé, prédiction marquée: ❌")
 
                     return {
                         'type': 'edit_message',
@@ -7,10 +7,30 @@ Ce fichier contient la classe CardPredictor complète.
 import re
 import logging
 from datetime import datetime
-from typing import Optional, Dict, List, Tuple, Any, Set
+from functools import lru_cache, wraps
+from typing import Optional, Dict, List, Tuple, Any, Set, NamedTuple
 import time
 import os
 import json
+import atexit
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, deque
+from operator import attrgetter
+
+# orjson (extension C) si disponible, sinon repli sur le module json standard
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode()
+
+    _loads = json.loads
 
 # Configuration du logger pour le débogage
 logger = logging.getLogger(__name__)
@@ -18,22 +38,145 @@ logger.setLevel(logging.INFO)
 
 # --- CONSTANTES ---
 HIGH_VALUE_CARDS = ["A", "K", "Q", "J"] 
+_HIGH_VALUE_SET = frozenset(HIGH_VALUE_CARDS)
+_HIGH_AKQ = frozenset(("A", "K", "Q"))
+_SET_89T = frozenset(("8", "9", "10"))
+_CARD_LETTERS = frozenset("AKQJakqj")
+_SUITS = frozenset(("♠️", "♥️", "❤️", "♦️", "♣️"))  # symbole + sélecteur de variante : 2 caractères
+_STATUS_SYMBOLS = {0: "✅0️⃣", 1: "✅1️⃣", 2: "✅2️⃣"}  # statut de succès selon le décalage N, N+1, N+2
+
+# --- PERSISTANCE DIFFÉRÉE ---
+FLUSH_INTERVAL = 2.0      # délai (secondes) avant l'écriture groupée des modifications d'une rafale
+FLUSH_MAX_CHANGES = 20    # écriture forcée après ce nombre de modifications
+_PERSISTED_FILES = {
+    "predictions.json": "predictions",
+    "processed.json": "_processed_order",
+    "last_prediction_time.json": "last_prediction_time",
+    "inter_mode_status.json": "is_inter_mode_active",
+    "smart_rules.json": "smart_rules",
+}
+
+PROCESSED_MAX = 10000  # numéros de jeu déjà prédits conservés (fenêtre glissante)
+
+# Historiques en ajout seul (une entrée JSON par ligne)
+INTER_DATA_FILE = "inter_data.jsonl"
+SEQUENTIAL_HISTORY_FILE = "sequential_history.jsonl"
+JSONL_COMPACT_RATIO = 0.75  # réécriture quand moins de 75 % des lignes restent utiles
+
+# --- PATTERNS REGEX (compilés une seule fois au chargement du module) ---
+_RE_TOTAL = re.compile(r'#T(\d+)')
+# Numéro de jeu : le tag #N est prioritaire, 🔵N🔵 n'est utilisé qu'en son absence
+_RE_GAME = re.compile(r'#N(\d+)\.', re.IGNORECASE)
+_RE_GAME_BLUE = re.compile(r'🔵(\d+)🔵')
+_RE_PAREN_ALL = re.compile(r'\(([^)]*)\)')
+_RE_OR_TAG = re.compile(r'\b[OR]\b')
+_RE_CARD_VAL = re.compile(r'(\d+|[AKQJ])')
 
 # ---------- FONCTIONS UTILITAIRES D'EXTRACTION (Hors classe) ----------
 
 def extract_total_points(msg: str) -> Optional[int]:
     """Extrait le total des points #T."""
-    m = re.search(r'#T(\d+)', msg)
+    m = _RE_TOTAL.search(msg)
     return int(m.group(1)) if m else None
 
+_ts_cache = [0, ""]
+
+def _now_iso() -> str:
+    """Horodatage ISO mis en cache à la seconde (évite datetime.now() à chaque message)."""
+    t = int(time.time())
+    if t != _ts_cache[0]:
+        _ts_cache[0] = t
+        _ts_cache[1] = datetime.fromtimestamp(t).isoformat()
+    return _ts_cache[1]
+
+def _card_details(content: str) -> List[Tuple[str, str]]:
+    r"""
+    Extrait les couples (valeur, couleur) d'un groupe de cartes.
+    Parcours caractère par caractère équivalent à (\d+|[AKQJ])(♠️|♥️|❤️|♦️|♣️) insensible à la casse,
+    ❤️ étant normalisé en ♥️ à la construction du couple.
+    """
+    s = content
+    cards = []
+    i, n = 0, len(s)
+    while i < n:
+        ch = s[i]
+        if ch.isdecimal():
+            j = i + 1
+            while j < n and s[j].isdecimal():
+                j += 1
+        elif ch in _CARD_LETTERS:
+            j = i + 1
+        else:
+            i += 1
+            continue
+
+        suit = s[j:j + 2]
+        if suit in _SUITS:
+            cards.append((s[i:j].upper(), "♥️" if suit == "❤️" else suit))
+            i = j + 2
+        else:
+            # Un préfixe numérique plus court serait suivi d'un chiffre : aucune carte possible avant j
+            i = j
+    return cards
+
+class ParsedMessage(NamedTuple):
+    """Résultat de l'analyse complète d'un message de jeu."""
+    game_number: Optional[int]
+    first_group: Optional[str]
+    first_cards: Tuple[Tuple[str, str], ...]
+    second_values: Tuple[str, ...]
+    q_present: bool
+    total_points: Optional[int]
+
+@lru_cache(maxsize=128)
+def _parse_message(msg: str) -> ParsedMessage:
+    """Analyse un message une seule fois ; les appels suivants sur le même texte sont servis par le cache."""
+    m = _RE_GAME.search(msg) or _RE_GAME_BLUE.search(msg)
+    game_number = int(m.group(1)) if m else None
+
+    groups = _RE_PAREN_ALL.findall(msg)
+    first_group = groups[0].strip() if groups else None
+    first_cards = tuple(_card_details(first_group)) if first_group else ()
+    second_values = tuple(v for v, _ in _card_details(groups[1])) if len(groups) > 1 else ()
+
+    return ParsedMessage(
+        game_number=game_number,
+        first_group=first_group,
+        first_cards=first_cards,
+        second_values=second_values,
+        q_present=any(value == "Q" for value, _ in first_cards),
+        total_points=extract_total_points(msg),
+    )
+
+def _locked(method):
+    """Exécute la méthode sous self.lock : la sauvegarde programmée ne voit jamais un état en cours de modification."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 # ---------- CLASSE CARDPREDICTOR ----------
 
 class CardPredictor:
     
     def __init__(self):
+        # Écritures disque déportées sur un thread dédié (seule la dernière version de chaque fichier est conservée)
+        self._pending_writes : Dict[str, bytes] = {}
+        self._writes_cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        threading.Thread(target=self._writer_loop, name="card-predictor-writer", daemon=True).start()
+
+        # Table de persistance construite une seule fois : fichier -> accesseur de l'attribut
+        self._persist_getters : Dict[str, attrgetter] = {
+            file: attrgetter(attr_name) for file, attr_name in _PERSISTED_FILES.items()
+        }
+
         # Données de persistance
-        self.predictions : Dict[int, Dict] = self._load_data('predictions.json') 
-        self.processed_messages : Set[int] = self._load_data('processed.json', is_set=True) 
+        self.predictions : Dict[int, Dict] = {int(k): v for k, v in self._load_data('predictions.json').items()}
+        # Fenêtre bornée des jeux déjà prédits (ordre d'ajout) + ensemble miroir pour l'appartenance en O(1)
+        self._processed_order : deque = deque(sorted(self._load_data('processed.json', is_set=True)), maxlen=PROCESSED_MAX)
+        self.processed_messages : Set[int] = set(self._processed_order)
         self.last_prediction_time : float = self._load_data('last_prediction_time.json', is_scalar=True)
         
         # Configuration des canaux (Fix pour les attributs manquants)
@@ -42,11 +185,33 @@ class CardPredictor:
         self.prediction_channel_id : Optional[int] = self.config_data.get('prediction_channel_id', None)
         
         # Logique INTER & Historique
-        self.sequential_history : Dict[int, Dict] = self._load_data("sequential_history.json", is_sequential_history=True)
-        self.inter_data : List[Dict]      = self._load_data("inter_data.json", is_list=True)
+        self.sequential_history : Dict[int, Dict] = self._load_sequential_history()
+        self.inter_data : List[Dict]      = self._load_jsonl(INTER_DATA_FILE, "inter_data.json")
         self.is_inter_mode_active : bool = self._load_data("inter_mode_status.json", is_inter_active=True)
         self.smart_rules : List[Dict]      = self._load_data("smart_rules.json", is_list=True)
         self.prediction_cooldown = 30
+
+        # Index des numéros de résultat déjà enregistrés (anti-doublon en O(1))
+        self._inter_resultat_set : Set[int] = {e['numero_resultat'] for e in self.inter_data}
+
+        # Dernier jeu avec Q et numéros de l'historique triés (comptage d'absence par bisect)
+        self._last_q_game : int = max(self._inter_resultat_set, default=0)
+        self._seq_keys : List[int] = sorted(self.sequential_history)
+
+        # Numéros de jeu des prédictions Q en attente, triés (fenêtre de vérification par bisect)
+        self._pending_pred_games : List[int] = sorted(
+            g for g, p in self.predictions.items()
+            if p.get('status') == 'pending' and p.get('predicted_costume') == 'Q'
+        )
+
+        # Fichiers modifiés en attente d'écriture (vidés par flush, et à l'arrêt du processus)
+        self._dirty : Set[str] = set()
+        self._dirty_changes = 0
+        # Écriture programmée par la première modification d'une rafale (thread minuteur) ;
+        # les méthodes publiques qui modifient l'état tiennent self.lock (@_locked)
+        self._flush_timer : Optional[threading.Timer] = None
+        self.lock = threading.RLock()
+        atexit.register(self._flush_on_exit)
         
         # Initialisation ou recalcul des règles si nécessaire
         if not os.path.exists('channels_config.json') and (self.target_channel_id is None or self.prediction_channel_id is None):
@@ -55,12 +220,14 @@ class CardPredictor:
         if self.is_inter_mode_active and not self.smart_rules and self.inter_data:
              self.analyze_and_set_smart_rules(initial_load=True) 
 
+        self._index_smart_rules()
+
     # ---------- GESTION DES DONNÉES (Persistance JSON) ----------
 
     def _load_data(self, file: str, is_set: bool = False, is_scalar: bool = False, is_list: bool = False, is_inter_active: bool = False, is_sequential_history: bool = False) -> Any:
         try:
-            with open(file, 'r') as f:
-                data = json.load(f)
+            with open(file, 'rb') as f:
+                data = _loads(f.read())
                 if is_set: return set(data)
                 if is_scalar: 
                     if file == 'inter_mode_status.json':
@@ -83,33 +250,126 @@ class CardPredictor:
     def _save_data(self, data: Any, file: str):
         if file == 'inter_mode_status.json':
             out = {'active': data}
-        elif isinstance(data, set):
+        elif isinstance(data, (set, deque)):
             out = list(data)
         else:
             out = data
                 
         try:
-            with open(file, "w") as f: 
-                json.dump(out, f, indent=2)
+            # Sérialisation sur le thread appelant (instantané cohérent), écriture sur le thread dédié
+            payload = _dumps(out)
         except Exception as e:
             logger.error(f"❌ Erreur _save_data {file} : {e}")
+            return
+
+        with self._writes_cond:
+            self._pending_writes[file] = payload
+            self._writes_cond.notify()
+
+    def _writer_loop(self):
+        while True:
+            with self._writes_cond:
+                while not self._pending_writes:
+                    self._writes_cond.wait()
+            self._write_pending()
+
+    def _write_pending(self):
+        """Écrit les fichiers en attente ; le verrou garantit qu'une version récente n'est jamais écrasée par une ancienne."""
+        with self._write_lock:
+            with self._writes_cond:
+                batch, self._pending_writes = self._pending_writes, {}
+            for file, payload in batch.items():
+                try:
+                    # Écriture atomique : un arrêt brutal ne laisse jamais de fichier tronqué
+                    tmp_file = f"{file}.tmp"
+                    with open(tmp_file, "wb") as f:
+                        f.write(payload)
+                    os.replace(tmp_file, file)
+                except Exception as e:
+                    logger.error(f"❌ Erreur _save_data {file} : {e}")
+
+    # ---------- HISTORIQUES JSONL (ajout seul) ----------
+
+    def _load_jsonl(self, file: str, legacy_file: str) -> List[Dict]:
+        """Charge un fichier JSONL ; migre l'ancien fichier JSON s'il n'a pas encore été converti."""
+        if not os.path.exists(file) and os.path.exists(legacy_file):
+            entries = self._load_data(legacy_file, is_list=True)
+            if isinstance(entries, dict):
+                entries = [{'g': int(k), **v} for k, v in entries.items()]
+            self._rewrite_jsonl(file, entries)
+            return entries
+
+        entries = []
+        try:
+            with open(file, 'rb') as f:
+                for line in f.readlines():
+                    if line.strip():
+                        entries.append(_loads(line))
+        except FileNotFoundError:
+            pass
+        except (ValueError, json.JSONDecodeError) as e:
+            logger.error(f"❌ Erreur _load_jsonl {file} : {e}")
+        return entries
+
+    def _load_sequential_history(self) -> Dict[int, Dict]:
+        entries = self._load_jsonl(SEQUENTIAL_HISTORY_FILE, "sequential_history.json")
+        self._seq_file_lines = len(entries)
+        # Une ligne plus récente pour le même jeu remplace la précédente
+        return {entry.pop('g'): entry for entry in entries}
+
+    def _append_jsonl(self, file: str, entry: Dict):
+        try:
+            with open(file, "ab") as f:
+                f.write(_dumps(entry) + b"\n")
+        except Exception as e:
+            logger.error(f"❌ Erreur _append_jsonl {file} : {e}")
+
+    def _rewrite_jsonl(self, file: str, entries: List[Dict]):
+        try:
+            tmp_file = f"{file}.tmp"
+            with open(tmp_file, "wb") as f:
+                f.writelines(_dumps(entry) + b"\n" for entry in entries)
+            os.replace(tmp_file, file)
+        except Exception as e:
+            logger.error(f"❌ Erreur _rewrite_jsonl {file} : {e}")
 
     def _save_all_data(self):
-        for attr_name, file in [
-            ("predictions", "predictions.json"),
-            ("processed_messages", "processed.json"),
-            ("last_prediction_time", "last_prediction_time.json"),
-            ("sequential_history", "sequential_history.json"),
-            ("inter_data", "inter_data.json"),
-            ("is_inter_mode_active", "inter_mode_status.json"),
-            ("smart_rules", "smart_rules.json"),
-        ]: 
-            self._save_data(getattr(self, attr_name), file)
+        for file, get in self._persist_getters.items():
+            self._save_data(get(self), file)
             
         self.config_data['target_channel_id'] = self.target_channel_id
         self.config_data['prediction_channel_id'] = self.prediction_channel_id
         self._save_data(self.config_data, 'channels_config.json')
 
+    def _mark_dirty(self, *files: str):
+        """Marque des fichiers à sauvegarder ; les écritures d'une rafale sont regroupées."""
+        with self.lock:
+            self._dirty.update(files)
+            self._dirty_changes += 1
+            if self._dirty_changes >= FLUSH_MAX_CHANGES:
+                self.flush()
+            elif self._flush_timer is None:
+                # Sans nouvel événement, les dernières modifications sont écrites au plus tard après FLUSH_INTERVAL
+                self._flush_timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self):
+        """Écrit uniquement les fichiers marqués depuis la dernière sauvegarde."""
+        with self.lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            dirty, self._dirty = self._dirty, set()
+            self._dirty_changes = 0
+            for file in dirty:
+                self._save_data(self._persist_getters[file](self), file)
+
+    def _flush_on_exit(self):
+        """À l'arrêt : sauvegarde les modifications restantes et vide la file d'écriture de façon synchrone."""
+        self.flush()
+        self._write_pending()
+
     def can_make_prediction(self) -> bool:
         """Vérifie la période de refroidissement."""
         if not self.last_prediction_time:
@@ -118,6 +378,7 @@ class CardPredictor:
 
     # --- COMMANDES D'ADMINISTRATION (CORRECTION DES ATTRIBUTS MANQUANTS) ---
     
+    @_locked
     def set_channel_id(self, channel_id: int, channel_type: str) -> bool:
         """Définit les IDs de canal Source ou Prédiction."""
         if channel_type == 'source':
@@ -183,22 +444,13 @@ class CardPredictor:
 
     # --- Logique d'Extraction & Utilitaires ---
     def extract_game_number(self, message: str) -> Optional[int]:
-        match = re.search(r'#N(\d+)\.', message, re.IGNORECASE) or re.search(r'🔵(\d+)🔵', message)
-        return int(match.group(1)) if match else None
+        return _parse_message(message).game_number
 
     def extract_first_parentheses_content(self, message: str) -> Optional[str]:
-        pattern = r'\(([^)]*)\)' 
-        match = re.search(pattern, message)
-        return match.group(1).strip() if match else None
+        return _parse_message(message).first_group
         
     def extract_card_details(self, content: str) -> List[Tuple[str, str]]:
-        card_details = []
-        normalized_content = content.replace("❤️", "♥️")
-        card_pattern = r'(\d+|[AKQJ])(♠️|♥️|♦️|♣️)'
-        matches = re.findall(card_pattern, normalized_content, re.IGNORECASE)
-        for value, costume in matches:
-            card_details.append((value.upper(), costume))
-        return card_details
+        return _card_details(content)
 
     def get_first_two_cards(self, content: str) -> List[str]:
         card_details = self.extract_card_details(content)
@@ -206,39 +458,44 @@ class CardPredictor:
         return [f"{v}{c}" for v, c in first_two]
 
     def check_value_Q_in_first_parentheses(self, message: str) -> Optional[bool]:
-        first_parentheses_content = self.extract_first_parentheses_content(message)
-        if not first_parentheses_content: return None
-        card_details = self.extract_card_details(first_parentheses_content)
-        return any(value == "Q" for value, _ in card_details)
+        parsed = _parse_message(message)
+        if not parsed.first_group: return None
+        return parsed.q_present
         
     def count_absence_q(self) -> int:
         if not self.inter_data:
             # Si aucune donnée INTER n'existe, on compte depuis le dernier jeu enregistré
             return len(self.sequential_history)
         
-        # Récupère le numéro du dernier jeu où Q a été trouvé
-        last_q_game = max((e['numero_resultat'] for e in self.inter_data), default=0)
-        
-        # Compte le nombre de jeux enregistrés depuis ce dernier Q
-        recent_games_count = len([g for g in self.sequential_history if g > last_q_game])
-        return recent_games_count
+        # Compte le nombre de jeux enregistrés depuis le dernier Q (clés triées)
+        return len(self._seq_keys) - bisect_right(self._seq_keys, self._last_q_game)
 
     # --- Logique INTER (Apprentissage) ---
+    @_locked
     def collect_inter_data(self, game_number: int, message: str):
         """Collecte les données (Déclencheur à N-2, Dame Q à N) selon la logique séquentielle."""
-        first_group_content = self.extract_first_parentheses_content(message)
-        if not first_group_content: return
+        parsed = _parse_message(message)
+        if not parsed.first_group: return
+
+        # Le premier groupe est déjà analysé : il sert à l'historique et à la détection de Q
+        card_details = parsed.first_cards
 
         # 1. ENREGISTRER LE JEU ACTUEL DANS L'HISTORIQUE SÉQUENTIEL (N)
-        first_two_cards = self.get_first_two_cards(first_group_content)
+        first_two_cards = [f"{v}{c}" for v, c in card_details[:2]]
         if len(first_two_cards) == 2:
-            self.sequential_history[game_number] = {
+            entry = {
                 'cartes': first_two_cards,
-                'date': datetime.now().isoformat()
+                'values': [v for v, _ in card_details[:2]],
+                'date': _now_iso()
             }
+            if game_number not in self.sequential_history:
+                insort(self._seq_keys, game_number)
+            self.sequential_history[game_number] = entry
+            self._append_jsonl(SEQUENTIAL_HISTORY_FILE, {'g': game_number, **entry})
+            self._seq_file_lines += 1
         
         # 2. VÉRIFIER SI CE JEU (N) EST LE RÉSULTAT (Dame Q)
-        q_found = self.check_value_Q_in_first_parentheses(message)
+        q_found = parsed.q_present
         
         if q_found:
             n_minus_2_game = game_number - 2
@@ -248,111 +505,123 @@ class CardPredictor:
             # - Le déclencheur N-2 doit exister dans l'historique (sinon 0 entrées)
             # - Ce jeu N ne doit pas déjà être dans les données INTER
             if trigger_entry:
-                is_duplicate = any(entry.get('numero_resultat') == game_number for entry in self.inter_data)
-                
-                if not is_duplicate:
+                if game_number not in self._inter_resultat_set:
                     new_entry = {
                         'numero_resultat': game_number,
                         'declencheur': trigger_entry['cartes'],
                         'numero_declencheur': n_minus_2_game,
                         'carte_q': "Q", 
-                        'date_resultat': datetime.now().isoformat()
+                        'date_resultat': _now_iso()
                     }
                     self.inter_data.append(new_entry)
-                    self._save_all_data() 
+                    self._inter_resultat_set.add(game_number)
+                    self._last_q_game = max(self._last_q_game, game_number)
+                    self._append_jsonl(INTER_DATA_FILE, new_entry)
                     logger.info(f"💾 INTER DATA SUCCESS: Q à N={game_number} enregistré. Déclencheur N-2 trouvé: {trigger_entry['cartes']}")
         
         # 4. NETTOYAGE: Supprimer les entrées très anciennes (par exemple, plus de 50 jeux)
         obsolete_game_limit = game_number - 50 
-        self.sequential_history = {
-            num: entry for num, entry in self.sequential_history.items() if num >= obsolete_game_limit
-        }
-
-
+        # Les clés triées donnent directement les k entrées expirées : suppression en O(k)
+        expired_count = bisect_left(self._seq_keys, obsolete_game_limit)
+        if expired_count:
+            for num in self._seq_keys[:expired_count]:
+                del self.sequential_history[num]
+            del self._seq_keys[:expired_count]
+
+        # Compactage du fichier quand les lignes obsolètes dominent
+        if len(self.sequential_history) < JSONL_COMPACT_RATIO * self._seq_file_lines:
+            self._rewrite_jsonl(
+                SEQUENTIAL_HISTORY_FILE,
+                [{'g': num, **entry} for num, entry in self.sequential_history.items()]
+            )
+            self._seq_file_lines = len(self.sequential_history)
+
+
+    @_locked
     def analyze_and_set_smart_rules(self, initial_load: bool = False):
         """Analyse l'historique et définit les 3 règles les plus fréquentes."""
-        declencheur_counts = {}
-        for data in self.inter_data:
-            declencheur_key = tuple(data['declencheur']) 
-            declencheur_counts[declencheur_key] = declencheur_counts.get(declencheur_key, 0) + 1
-
-        sorted_declencheurs = sorted(
-            declencheur_counts.items(), 
-            key=lambda item: item[1], 
-            reverse=True
-        )
+        # Comptage en une passe puis sélection du top 3 par tas (sans tri complet)
+        declencheur_counts = Counter(tuple(data['declencheur']) for data in self.inter_data)
 
         top_3 = [
             {'cards': list(declencheur), 'count': count} 
-            for declencheur, count in sorted_declencheurs[:3]
+            for declencheur, count in declencheur_counts.most_common(3)
         ]
         self.smart_rules = top_3
+        self._index_smart_rules()
         
         if not initial_load:
             self.is_inter_mode_active = True if top_3 else False
 
-        self._save_data(self.is_inter_mode_active, 'inter_mode_status.json')
-        self._save_data(self.smart_rules, 'smart_rules.json')
+        self._mark_dirty('inter_mode_status.json', 'smart_rules.json')
         
+    @_locked
     def set_inter_mode(self, status: bool):
         """Active ou désactive le mode INTER."""
         self.is_inter_mode_active = status
         if status:
+            # L'analyse marque déjà les deux fichiers à écrire
             self.analyze_and_set_smart_rules() 
         else:
              self.smart_rules = [] 
-        
-        self._save_data(self.is_inter_mode_active, 'inter_mode_status.json')
-        self._save_data(self.smart_rules, 'smart_rules.json')
+             self._index_smart_rules()
+             self._mark_dirty('inter_mode_status.json', 'smart_rules.json')
+
+    def _index_smart_rules(self):
+        """Indexe les déclencheurs des règles actives pour une recherche en O(1)."""
+        self._smart_rule_set = frozenset(tuple(rule['cards']) for rule in self.smart_rules)
 
     # --- LOGIQUE DE PREDICTION (Les 8 règles) ---
+    @_locked
     def should_predict(self, message: str) -> Tuple[bool, Optional[int], Optional[str], Optional[str]]:
         """Détermine si une prédiction doit être faite."""
-        game_number = self.extract_game_number(message)
+        # 0. REJET IMMÉDIAT des messages en attente (🕐/⏰) : ils seront revus une fois finalisés,
+        # inutile de les analyser ou de les enregistrer
+        if '🕐' in message or '⏰' in message:
+            return False, None, None, None
+
+        parsed = _parse_message(message)
+        game_number = parsed.game_number
         if not game_number: return False, None, None, None
 
         # --- ÉTAPE CRITIQUE: Collecte de données pour INTER ---
         self.collect_inter_data(game_number, message) 
         
-        # 1. FILTRAGE STRICT (Messages en attente ou non finalisés)
-        if '🕐' in message or '⏰' in message or not ('✅' in message or '🔰' in message):
+        # 1. FILTRAGE STRICT (Messages non finalisés)
+        if not ('✅' in message or '🔰' in message):
             return False, None, None, None
             
         predicted_value = None
         confidence = None 
         
-        first_group_content = self.extract_first_parentheses_content(message)
-        total_points = extract_total_points(message) 
+        # Groupes, cartes et total déjà extraits par _parse_message
+        total_points = parsed.total_points
 
-        if not first_group_content: return False, None, None, None
+        if not parsed.first_group: return False, None, None, None
             
-        # Extraction des valeurs des deux groupes
-        card_details = self.extract_card_details(first_group_content)
-        card_values = [v for v, c in card_details]
-        
-        second_parentheses_pattern = r'\(([^)]*)\)'
-        all_matches = re.findall(second_parentheses_pattern, message)
-        second_group_content = all_matches[1] if len(all_matches) > 1 else ""
-        second_group_details = self.extract_card_details(second_group_content)
-        second_group_values = [v for v, c in second_group_details]
+        # Valeurs des deux groupes
+        card_values = [v for v, c in parsed.first_cards]
+        second_group_values = parsed.second_values
+        # Ensemble et compteur construits une fois : chaque règle interroge en O(1)
+        cv_set = set(card_values)
+        cv_cnt = Counter(card_values)
         
         
         # --- LOGIQUE DES 8 RÈGLES ---
         
         # Règle 1: LOGIQUE INTER (PRIORITÉ MAX)
         if self.is_inter_mode_active and self.smart_rules:
-            current_trigger_cards = self.get_first_two_cards(first_group_content)
-            current_trigger_tuple = tuple(current_trigger_cards)
+            current_trigger_tuple = tuple(f"{v}{c}" for v, c in parsed.first_cards[:2])
             
-            if any(tuple(rule['cards']) == current_trigger_tuple for rule in self.smart_rules):
+            if current_trigger_tuple in self._smart_rule_set:
                 predicted_value, confidence = "Q", "INTER"
         
         # Règle 2: Valet (J) Solitaire (98%)
-        elif card_values.count('J') == 1 and not any(v in ("A", "K", "Q") for v in card_values):
+        elif cv_cnt['J'] == 1 and cv_set.isdisjoint(_HIGH_AKQ):
             predicted_value, confidence = "Q", "98%"
         
         # Règle 3: Deux Valets (J) (57%)
-        elif card_values.count('J') >= 2:
+        elif cv_cnt['J'] >= 2:
             predicted_value, confidence = "Q", "57%"
 
         # Règle 4: Total des points élevé (#T > 40) (97%)
@@ -365,35 +634,35 @@ class CardPredictor:
         
         # Règle 6: Combinaison 8-9-10 (70%)
         else:
-            set_8_9_10 = {"8", "9", "10"}
-            is_8_9_10_combo = set_8_9_10.issubset(card_values) or set_8_9_10.issubset(second_group_values)
+            is_8_9_10_combo = _SET_89T.issubset(cv_set) or _SET_89T.issubset(second_group_values)
             if is_8_9_10_combo:
                 predicted_value, confidence = "Q", "70%"
         
         # Règle 7 & 8 (Bloc 70%)
         if not predicted_value:
             # 7a: K et J dans G1
-            has_k_j_g1 = 'K' in card_values and 'J' in card_values
+            has_k_j_g1 = 'K' in cv_set and 'J' in cv_set
             # 7b: Tag O ou R
-            is_o_r_tag = re.search(r'\b[OR]\b', message)
+            is_o_r_tag = _RE_OR_TAG.search(message)
             
             # 8: Deux groupes faibles consécutifs
-            is_current_g1_weak = not any(v in HIGH_VALUE_CARDS for v in card_values)
+            is_current_g1_weak = cv_set.isdisjoint(_HIGH_VALUE_SET)
             is_prev_g1_weak = False
             previous_entry = self.sequential_history.get(game_number - 1)
 
             if is_current_g1_weak and previous_entry:
-                # Extraction des valeurs des cartes N-1
-                previous_cards = previous_entry['cartes'] 
-                previous_values = [re.match(r'(\d+|[AKQJ])', c).group(1) for c in previous_cards if re.match(r'(\d+|[AKQJ])', c)]
-                is_prev_g1_weak = not any(v in HIGH_VALUE_CARDS for v in previous_values)
+                # Valeurs des cartes N-1 (déjà extraites à l'enregistrement ; ré-analyse pour les anciennes entrées)
+                previous_values = previous_entry.get('values') or [
+                    m.group(1) for m in map(_RE_CARD_VAL.match, previous_entry['cartes']) if m
+                ]
+                is_prev_g1_weak = _HIGH_VALUE_SET.isdisjoint(previous_values)
 
             if has_k_j_g1 or is_o_r_tag or (is_current_g1_weak and is_prev_g1_weak):
                  predicted_value, confidence = "Q", "70%"
 
 
         # --- FILTRE FINAL: Q déjà présente ---
-        if "Q" in card_values:
+        if "Q" in cv_set:
             return False, None, None, None
 
         # --- FILTRE FINAL: Cooldown ---
@@ -403,15 +672,24 @@ class CardPredictor:
         if predicted_value:
             # Utilisation de l'ID du jeu au lieu du hash du message pour l'unicité
             if game_number not in self.processed_messages:
-                self.processed_messages.add(game_number)
+                self._add_processed(game_number)
                 self.last_prediction_time = time.time()
-                self._save_all_data()
+                self._mark_dirty('processed.json', 'last_prediction_time.json')
                 # On retourne le texte de prédiction formaté avec la confiance
                 prediction_text = self.make_prediction(game_number, predicted_value, confidence)
                 return True, game_number, predicted_value, prediction_text # On retourne le texte à envoyer
         
         return False, None, None, None
         
+    def _add_processed(self, game_number: int):
+        """Ajoute un jeu traité ; le plus ancien sort de la fenêtre (et de l'ensemble) quand elle est pleine."""
+        order = self._processed_order
+        if len(order) == order.maxlen:
+            self.processed_messages.discard(order[0])
+        order.append(game_number)
+        self.processed_messages.add(game_number)
+
+    @_locked
     def make_prediction(self, game_number: int, predicted_value: str, confidence: str) -> str:
         """Génère le message de prédiction et l'enregistre avec la confiance."""
         target_game = game_number + 2
@@ -428,21 +706,28 @@ class CardPredictor:
             'message_id': None, 
             'confidence': confidence # <-- STOCKAGE de la CONFIANCE
         }
-        self._save_all_data()
+        i = bisect_left(self._pending_pred_games, target_game)
+        if i == len(self._pending_pred_games) or self._pending_pred_games[i] != target_game:
+            self._pending_pred_games.insert(i, target_game)
+        self._mark_dirty('predictions.json')
         return prediction_text
         
-        def verify(self, text: str) -> Optional[Dict]:
+    @_locked
+    def verify(self, text: str) -> Optional[Dict]:
         """Vérifie si le message contient le résultat pour une prédiction en attente (Q)."""
-        game_number = self.extract_game_number(text)
-        if not game_number or not self.predictions:
+        parsed = _parse_message(text)
+        game_number = parsed.game_number
+        if not game_number or not self._pending_pred_games:
             return None
 
         # Filtrage des messages en attente ou non finalisés
         if '🕐' in text or '⏰' in text or not ('✅' in text or '🔰' in text):
             return None
 
-        # Tri par clé pour vérifier les plus anciennes d'abord (meilleure pratique)
-        for predicted_game in sorted(self.predictions.keys()):
+        # Seules les prédictions N-2..N peuvent correspondre : fenêtre par bisect, plus anciennes d'abord
+        pending = self._pending_pred_games
+        window = pending[bisect_left(pending, game_number - 2):bisect_right(pending, game_number)]
+        for predicted_game in window:
             prediction = self.predictions[predicted_game]
 
             if prediction.get('status') != 'pending' or prediction.get('predicted_costume') != 'Q':
@@ -455,19 +740,19 @@ class CardPredictor:
 
             # Vérification pour N, N+1, N+2 par rapport à la prédiction
             if 0 <= verification_offset <= 2:
-                status_symbol_map = {0: "✅0️⃣", 1: "✅1️⃣", 2: "✅2️⃣"}
-                q_found = self.check_value_Q_in_first_parentheses(text)
+                q_found = parsed.q_present
                 
                 if q_found:
                     # SUCCÈS - Dame (Q) trouvée
-                    status_symbol = status_symbol_map[verification_offset]
+                    status_symbol = _STATUS_SYMBOLS[verification_offset]
                     updated_message = f"🔵{predicted_game}🔵:Valeur Q statut :{status_symbol}{confidence_tag}" # <-- AJOUTE la CONFIANCE
                     
                     prediction['status'] = f'correct_offset_{verification_offset}'
                     prediction['verification_count'] = verification_offset
                     prediction['final_message'] = updated_message
                     self.predictions.pop(predicted_game, None) # Nettoyage après succès
-                    self._save_all_data()
+                    pending.remove(predicted_game)
+                    self._mark_dirty('predictions.json')
                     
                     return {
                         'type': 'edit_message',
@@ -483,7 +768,8 @@ class CardPredictor:
                     prediction['status'] = 'failed'
                     prediction['final_message'] = updated_message
                     self.predictions.pop(predicted_game, None) # Nettoyage après échec final
-                    self._save_all_data()
+                    pending.remove(predicted_game)
+                    self._mark_dirty('predictions.json')
                     
                     return {
                         'type': 'edit_message',
@@ -5,6 +5,7 @@ Configuration settings for the Telegram bot
 """
 import os
 import logging
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -27,7 +28,7 @@ class Config:
         
         # Détermination de l'URL du Webhook
         self.WEBHOOK_URL = self._determine_webhook_url()
-        logger.info(f"🔗 Webhook URL configuré: {self.WEBHOOK_URL}")
+        logger.info("🔗 Webhook URL configuré: %s", self.WEBHOOK_URL)
 
         # Port pour le serveur (utilise PORT env ou 5000 par défaut)
         self.PORT = int(os.getenv('PORT') or 5000)
@@ -35,6 +36,9 @@ class Config:
         # Canaux (Les vraies valeurs sont gérées par CardPredictor)
         self.TARGET_CHANNEL_ID = DEFAULT_TARGET_CHANNEL_ID
         self.PREDICTION_CHANNEL_ID = DEFAULT_PREDICTION_CHANNEL_ID
+
+        # Admin (ADMIN_CHAT_ID, ou ADMIN_ID comme dans render.yaml) : entier calculé une seule fois
+        self.ADMIN_CHAT_ID = self._safe_int(os.getenv('ADMIN_CHAT_ID') or os.getenv('ADMIN_ID'))
         
         # Mode Debug
         self.DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
@@ -54,9 +58,17 @@ class Config:
             logger.error("❌ Format de token invalide")
             raise ValueError("Invalid bot token format")
 
-        logger.info(f"✅ BOT_TOKEN configuré: {token[:10]}...")
+        logger.info("✅ BOT_TOKEN configuré: %s...", token[:10])
         return token
     
+    @staticmethod
+    def _safe_int(value) -> Optional[int]:
+        """Convertit un ID en entier, None si absent ou invalide."""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
     def _determine_webhook_url(self) -> str:
         """Détermine l'URL du webhook avec priorité à l'ENV."""
         webhook_url = os.getenv('WEBHOOK_URL')
@@ -0,0 +1,11 @@
+# gunicorn.conf.py
+
+"""
+Configuration gunicorn (chargée automatiquement depuis le répertoire de lancement)
+"""
+
+
+def post_worker_init(worker):
+    """Enregistre le webhook une fois l'application chargée dans le worker (main:app, --workers 1)."""
+    from main import setup_webhook
+    setup_webhook()
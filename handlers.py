@@ -4,11 +4,29 @@ import logging
 import os
 import re
 from datetime import datetime, timedelta
-from collections import defaultdict
-from typing import Dict, Any, Optional, List, Tuple
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional, List, Tuple, Union
 import requests 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import json # Assurez-vous que json est importé
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# orjson (extension C) si disponible, sinon repli sur le module json standard
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode()
+
+    _loads = json.loads
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -24,6 +42,8 @@ except ImportError:
             self.prediction_channel_id = None
             self.is_inter_mode_active = False
             self.inter_data = []
+            self.predictions = {}
+            self.lock = threading.RLock()
         def set_channel_id(self, *args):
             logger.error("CardPredictor non chargé, impossible de définir l'ID du canal.")
             return False
@@ -31,14 +51,91 @@ except ImportError:
             return "Système INTER non disponible.", None
         def analyze_and_set_smart_rules(self, *args): return []
         def _save_data(self, *args): pass
+        def _mark_dirty(self, *files): pass
         # Ajoutez toutes les autres méthodes appelées si nécessaire
     logger.error("❌ Échec de l'importation de CardPredictor. Les fonctionnalités de prédiction seront désactivées.")
     
 
+# --- HTTP TELEGRAM ---
+HTTP_TIMEOUT = (3.05, 10)  # (connexion, lecture) en secondes
+_JSON_HEADERS = {'Content-Type': 'application/json'}  # corps déjà sérialisé par _dumps
+EDIT_INTERVAL = 0.8  # secondes minimum entre deux éditions dans un même chat (limite de flood Telegram)
+# Threads d'envoi par file (envois / éditions) : chaque chat est rattaché à l'un d'eux (ordre préservé
+# par chat, nombre de threads borné quel que soit le nombre d'utilisateurs)
+CHAT_WORKERS = 8
+_CHAT_LANES = (None, 'edits')
+# Réessais sur erreurs transitoires ; pas de réessai après un délai de lecture (le message a pu partir)
+HTTP_RETRY = Retry(
+    total=3, read=0, backoff_factor=0.2,
+    status_forcelist=(429, 502, 503, 504),
+    allowed_methods=frozenset({"GET", "POST"}),
+    respect_retry_after_header=True,
+)
+
 # Limites de débit (Logique conservée pour la robustesse)
-user_message_counts = defaultdict(list)
+# Horodatages monotones des dernières commandes par utilisateur (les plus anciens à gauche),
+# en LRU : les utilisateurs sans commande dans la fenêtre sont retirés par la tête, et au-delà de
+# RATE_LIMIT_MAX_USERS, l'utilisateur inactif depuis le plus longtemps est oublié
+user_message_counts: "OrderedDict[int, deque]" = OrderedDict()
 MAX_MESSAGES_PER_MINUTE = 30
 RATE_LIMIT_WINDOW = 60
+RATE_LIMIT_MAX_USERS = 10000
+
+
+def is_rate_limited(user_id: int) -> bool:
+    """Fenêtre glissante : True si l'utilisateur a déjà envoyé MAX_MESSAGES_PER_MINUTE commandes dans la fenêtre."""
+    now = time.monotonic()
+    cutoff = now - RATE_LIMIT_WINDOW
+    # Oubli des utilisateurs inactifs : en tête du LRU, tant que leur dernière commande est hors fenêtre
+    while user_message_counts:
+        oldest = next(iter(user_message_counts.values()))
+        if oldest and oldest[-1] > cutoff:
+            break
+        user_message_counts.popitem(last=False)
+    timestamps = user_message_counts.get(user_id)
+    if timestamps is None:
+        timestamps = user_message_counts[user_id] = deque()
+        if len(user_message_counts) > RATE_LIMIT_MAX_USERS:
+            user_message_counts.popitem(last=False)
+    else:
+        user_message_counts.move_to_end(user_id)
+    # Seuls les horodatages expirés, en tête de file, sont retirés (simple comparaison de flottants)
+    while timestamps and timestamps[0] <= cutoff:
+        timestamps.popleft()
+    if len(timestamps) >= MAX_MESSAGES_PER_MINUTE:
+        return True
+    timestamps.append(now)
+    return False
+
+# Journal des erreurs d'envoi : seau à jetons (pannes Telegram = une erreur par requête)
+ERROR_LOG_RATE = 5              # erreurs journalisées par seconde au maximum (et rafale maximale)
+ERROR_LOG_SUMMARY_INTERVAL = 5  # secondes entre deux résumés des erreurs ignorées
+_error_log_lock = threading.Lock()
+_error_log_state = {'tokens': float(ERROR_LOG_RATE), 'refill_at': 0.0, 'suppressed': 0, 'summary_at': 0.0}
+
+
+def log_send_error(method: str, chat_id: int, error: Exception) -> None:
+    """Journalise une erreur d'envoi ; au-delà de ERROR_LOG_RATE/s, les erreurs sont comptées et résumées."""
+    now = time.monotonic()
+    with _error_log_lock:
+        state = _error_log_state
+        state['tokens'] = min(ERROR_LOG_RATE, state['tokens'] + (now - state['refill_at']) * ERROR_LOG_RATE)
+        state['refill_at'] = now
+        suppressed = 0
+        if state['suppressed'] and now - state['summary_at'] >= ERROR_LOG_SUMMARY_INTERVAL:
+            suppressed, state['suppressed'] = state['suppressed'], 0
+            state['summary_at'] = now
+        allowed = state['tokens'] >= 1
+        if allowed:
+            state['tokens'] -= 1
+        else:
+            state['suppressed'] += 1
+            if state['suppressed'] == 1:
+                state['summary_at'] = now
+    if suppressed:
+        logger.error("❌ %d erreurs d'envoi Telegram ignorées dans le journal ces %d dernières secondes", suppressed, ERROR_LOG_SUMMARY_INTERVAL)
+    if allowed:
+        logger.error("❌ Erreur %s Telegram à %s: %s", method, chat_id, error)
 
 # Messages
 WELCOME_MESSAGE = """
@@ -52,6 +149,13 @@ WELCOME_MESSAGE = """
 
 🎯 **Version DEPLOY299999 - Port 10000**
 """
+# Message de configuration envoyé quand le bot est ajouté à un chat
+_CONFIG_PROMPT = (
+    "**🚨 Configuration du Canal 🚨**\n\n"
+    "Le bot a été ajouté au chat **`{chat_title}`** (ID: `{chat_id}`).\n\n"
+    "Veuillez confirmer le rôle de ce chat pour les prédictions Dame (Q):"
+)
+
 # --- CONSTANTES POUR LES CALLBACKS DE CONFIGURATION ---
 CALLBACK_SOURCE = "config_source"
 CALLBACK_PREDICTION = "config_prediction"
@@ -61,6 +165,35 @@ CALLBACK_CANCEL = "config_cancel"
 CALLBACK_INTER_APPLY = "inter_apply"
 CALLBACK_INTER_DEFAULT = "inter_default"
 
+# --- BOUTONS (callback_data) -> méthode du handler ---
+_CALLBACKS = {
+    CALLBACK_SOURCE: '_callback_source',
+    CALLBACK_PREDICTION: '_callback_prediction',
+    CALLBACK_CANCEL: '_callback_cancel',
+    CALLBACK_INTER_APPLY: '_callback_inter_apply',
+    CALLBACK_INTER_DEFAULT: '_callback_inter_default',
+}
+
+# --- COMMANDES (premier mot du message, sans le suffixe @nom_du_bot) -> méthode du handler ---
+_COMMANDS = {
+    '/start': '_handle_start_command',
+    '/stat': '_handle_stat_command',
+    '/bilan': '_handle_bilan_command',
+    '/inter': '_handle_inter_command',
+}
+
+# Marqueurs de numéro de jeu reconnus par CardPredictor.extract_game_number (#N123. ou 🔵123🔵) :
+# sans eux, ni vérification ni prédiction ne sont possibles
+_RELEVANT_RE = re.compile(r'#N\d+\.|🔵\d+🔵', re.IGNORECASE)
+
+# --- ROUTAGE DES UPDATES DE TYPE MESSAGE (clé de l'update -> méthode du handler) ---
+_MESSAGE_KEYS = (
+    ('message', '_handle_message'),
+    ('edited_message', '_handle_edited_message'),
+    ('channel_post', '_handle_message'),
+    ('edited_channel_post', '_handle_edited_message'),
+)
+
 
 # Fonction utilitaire pour l'Inline Keyboard de configuration
 def get_config_keyboard() -> Dict:
@@ -76,51 +209,145 @@ def get_config_keyboard() -> Dict:
     ]
     return {'inline_keyboard': keyboard}
 
+# Corps JSON des réponses fixes, sérialisés une seule fois au chargement
+_CONFIG_KEYBOARD_JSON = _dumps(get_config_keyboard()).decode()
+# /start : corps complet sans le chat_id (préfixé à l'envoi), '{' initial retiré
+_WELCOME_BODY_TAIL = _dumps({'text': WELCOME_MESSAGE, 'parse_mode': 'Markdown'})[1:]
+
 
 class TelegramHandlers:
     """Handlers for Telegram bot using webhook approach"""
 
     def __init__(self, bot_token: str):
         self.bot_token = bot_token
+        # ID du bot (partie numérique du token) : reconnaît ses propres événements my_chat_member
+        self.bot_id = int(bot_token.split(':', 1)[0])
         self.base_url = f"https://api.telegram.org/bot{bot_token}"
+        # URLs des méthodes appelées à chaque message, construites une seule fois
+        self._send_url = f"{self.base_url}/sendMessage"
+        self._edit_url = f"{self.base_url}/editMessageText"
+        self._answer_url = f"{self.base_url}/answerCallbackQuery"
+
+        # Session HTTP partagée : connexions keep-alive vers api.telegram.org (une seule poignée TLS)
+        self.session = requests.Session()
+        # Un seul hôte (api.telegram.org) ; pool_maxsize couvre les threads d'envoi et d'édition,
+        # les accusés de boutons et le polling, qui partagent la session (au-delà, les connexions
+        # seraient fermées après usage)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=32, max_retries=HTTP_RETRY)
+        self.session.mount("https://", adapter)
         
         # Initialize advanced handlers
         self.card_predictor: Optional[CardPredictor] = None
         if CardPredictor:
             self.card_predictor = CardPredictor()
 
+        # CHAT_WORKERS exécuteurs à un seul thread par file (envois / éditions), créés une fois : les appels
+        # HTTP d'un chat restent ordonnés sans bloquer le traitement des updates (threads démarrés à l'usage)
+        self._chat_executors: Dict[Optional[str], List[ThreadPoolExecutor]] = {
+            lane: [
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"chat-{lane or 'send'}-{i}")
+                for i in range(CHAT_WORKERS)
+            ]
+            for lane in _CHAT_LANES
+        }
+        # Accusés de réception non ordonnés (answerCallbackQuery) : hors des files des chats
+        self._background = ThreadPoolExecutor(max_workers=4, thread_name_prefix="telegram-bg")
+        # Envoi en cours de chaque prédiction : son édition attend le message_id
+        self._pending_sends: Dict[int, Future] = {}
+
+        # Éditions en attente par (chat, message) : seul le dernier texte est envoyé
+        self._pending_edits: Dict[Tuple[int, int], Tuple[str, Optional[str], Optional[Dict]]] = {}
+        self._pending_edits_lock = threading.Lock()
+        self._last_edit_at: Dict[int, float] = {}
+
+        # Réponse au webhook en cours de traitement (par thread) : la première réponse à une
+        # commande est renvoyée dans le corps HTTP du webhook au lieu d'un appel sendMessage
+        self._webhook = threading.local()
+
+        # Table de commandes résolue une fois : commande -> méthode liée
+        self._commands = {command: getattr(self, name) for command, name in _COMMANDS.items()}
+        self._callbacks = {data: getattr(self, name) for data, name in _CALLBACKS.items()}
+
+    def _submit_to_chat(self, chat_id: int, fn, *args, lane: Optional[str] = None) -> Future:
+        """
+        Exécute fn(*args) sur le thread auquel le chat est rattaché (ordre préservé par chat).
+        Avec lane, la file est distincte : ses appels partent en parallèle de ceux de la file principale.
+        """
+        executor = self._chat_executors[lane][hash(chat_id) % CHAT_WORKERS]
+
+        def run():
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error("❌ Erreur d'envoi asynchrone vers %s: %s", chat_id, e, exc_info=True)
+
+        return executor.submit(run)
+
 
     # --- MÉTHODES D'INTERACTION TELEGRAM (requests) ---
 
-    def send_message(self, chat_id: int, text: str, parse_mode='Markdown', message_id: Optional[int] = None, edit=False, reply_markup: Optional[Dict] = None) -> Optional[Dict]:
-        """Envoie ou édite un message via requests."""
+    def send_message(self, chat_id: int, text: str, parse_mode: Optional[str] = None, message_id: Optional[int] = None, edit=False, reply_markup: Optional[Union[Dict, str]] = None) -> Optional[Dict]:
+        """Envoie ou édite un message via requests (texte brut sauf parse_mode explicite)."""
         if message_id or edit:
-            method = 'editMessageText'
-            payload = {'chat_id': chat_id, 'message_id': message_id, 'text': text, 'parse_mode': parse_mode}
+            method, url = 'editMessageText', self._edit_url
+            payload = {'chat_id': chat_id, 'message_id': message_id, 'text': text}
         else:
-            method = 'sendMessage'
-            payload = {'chat_id': chat_id, 'text': text, 'parse_mode': parse_mode}
-        
+            method, url = 'sendMessage', self._send_url
+            payload = {'chat_id': chat_id, 'text': text}
+        if parse_mode:
+            payload['parse_mode'] = parse_mode
+
+        # Sérialiser reply_markup en JSON si présent (déjà sérialisé pour les claviers fixes)
         if reply_markup:
-             payload['reply_markup'] = reply_markup
+            payload['reply_markup'] = reply_markup if isinstance(reply_markup, str) else _dumps(reply_markup).decode()
+
+        # Première réponse pendant un webhook : renvoyée à Telegram dans la réponse HTTP (un aller-retour de moins)
+        if method == 'sendMessage' and getattr(self._webhook, 'capture', False) and self._webhook.reply is None:
+            payload['method'] = method
+            self._webhook.reply = payload
+            return {'ok': True, 'result': None}
+
+        return self._post_json(method, url, chat_id, _dumps(payload))
+
+    def send_webhook_reply(self, payload: Dict) -> None:
+        """Envoie par l'API (file du chat) une réponse préparée pour le corps d'un webhook."""
+        body = {key: value for key, value in payload.items() if key != 'method'}
+        chat_id = body['chat_id']
+        self._submit_to_chat(chat_id, self._post_json, 'sendMessage', self._send_url, chat_id, _dumps(body))
 
-        url = f"{self.base_url}/{method}"
+    def _post_json(self, method: str, url: str, chat_id: int, body: bytes) -> Optional[Dict]:
+        """Poste un corps JSON déjà sérialisé ; None en cas d'erreur réseau/HTTP."""
         try:
-            # Sérialiser reply_markup en JSON si présent
-            if 'reply_markup' in payload:
-                payload['reply_markup'] = json.dumps(payload['reply_markup'])
-                
-            response = requests.post(url, json=payload, timeout=10)
+            response = self.session.post(url, data=body, headers=_JSON_HEADERS, timeout=HTTP_TIMEOUT)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Erreur {method} Telegram à {chat_id}: {e}")
+            return _loads(response.content)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log_send_error(method, chat_id, e)
             return None
 
-    def edit_message(self, chat_id: int, message_id: int, text: str, parse_mode='Markdown', reply_markup: Optional[Dict] = None) -> bool:
-        """Fonction utilitaire pour l'édition de message."""
-        result = self.send_message(chat_id, text, parse_mode, message_id, edit=True, reply_markup=reply_markup)
-        return result.get('ok', False) if result else False
+    def edit_message(self, chat_id: int, message_id: int, text: str, parse_mode: Optional[str] = None, reply_markup: Optional[Dict] = None) -> bool:
+        """
+        Programme l'édition d'un message sur le thread du chat.
+        Les éditions rapprochées du même message sont fusionnées : seul le dernier texte part.
+        """
+        key = (chat_id, message_id)
+        with self._pending_edits_lock:
+            already_scheduled = key in self._pending_edits
+            self._pending_edits[key] = (text, parse_mode, reply_markup)
+        if not already_scheduled:
+            self._submit_to_chat(chat_id, self._flush_edit, key, lane='edits')
+        return True
+
+    def _flush_edit(self, key: Tuple[int, int]) -> None:
+        """Envoie la dernière version d'une édition en respectant EDIT_INTERVAL pour le chat."""
+        chat_id, message_id = key
+        wait = self._last_edit_at.get(chat_id, 0.0) + EDIT_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        with self._pending_edits_lock:
+            text, parse_mode, reply_markup = self._pending_edits.pop(key)
+        self.send_message(chat_id, text, parse_mode, message_id, edit=True, reply_markup=reply_markup)
+        self._last_edit_at[chat_id] = time.monotonic()
             
     def process_prediction_action(self, action: Dict):
         """Traite les actions de prédiction/vérification (envoi/édition)."""
@@ -132,52 +359,87 @@ class TelegramHandlers:
         new_message = action.get('new_message')
         chat_id = self.card_predictor.prediction_channel_id 
 
+        # Envois et éditions sur deux files : la vérification (édition) d'un jeu et la nouvelle
+        # prédiction déclenchées par un même message partent en parallèle (un aller-retour au lieu de deux)
         if action.get('type') == 'new_prediction':
-            result = self.send_message(chat_id=chat_id, text=new_message)
-            
-            if result and result.get('ok'):
-                message_id = result['result']['message_id']
-                if predicted_game in self.card_predictor.predictions:
-                    self.card_predictor.predictions[predicted_game]['message_id'] = message_id
+            future = self._submit_to_chat(chat_id, self._send_prediction, chat_id, predicted_game, new_message)
+            self._pending_sends[predicted_game] = future
+            future.add_done_callback(lambda f, game=predicted_game: self._forget_send(game, f))
             
         elif action.get('type') == 'edit_message':
-            prediction_data = self.card_predictor.predictions.get(predicted_game)
-            message_id = prediction_data.get('message_id') if prediction_data else None
-
-            if message_id:
-                self.edit_message(
-                    chat_id=chat_id, 
-                    text=new_message,
-                    message_id=message_id
-                )
-            else:
-                self.send_message(chat_id=chat_id, text=new_message)
+            send_future = self._pending_sends.get(predicted_game)
+            self._submit_to_chat(chat_id, self._edit_prediction, chat_id, predicted_game, new_message, send_future, lane='edits')
+
+    def _forget_send(self, predicted_game: int, future: Future) -> None:
+        """Oublie un envoi terminé, sauf s'il a déjà été remplacé par un envoi plus récent."""
+        if self._pending_sends.get(predicted_game) is future:
+            self._pending_sends.pop(predicted_game, None)
+
+    def _send_prediction(self, chat_id: int, predicted_game: int, new_message: str) -> None:
+        """Envoie une nouvelle prédiction et mémorise l'ID du message pour l'édition future."""
+        result = self.send_message(chat_id=chat_id, text=new_message)
         
-        # S'assurer que les données de prédiction sont sauvegardées après l'action
-        if hasattr(self.card_predictor, '_save_all_data'):
-            self.card_predictor._save_all_data()
+        if result and result.get('ok'):
+            message_id = result['result']['message_id']
+            with self.card_predictor.lock:
+                if predicted_game in self.card_predictor.predictions:
+                    self.card_predictor.predictions[predicted_game].message_id = message_id
+                    # Persisté par l'écriture groupée : les éditions après un redémarrage retrouvent le message
+                    self.card_predictor._mark_dirty('predictions.json')
+
+    def _edit_prediction(self, chat_id: int, predicted_game: int, new_message: str, send_future: Optional[Future] = None) -> None:
+        """Édite la prédiction (ou renvoie un message si l'ID est inconnu)."""
+        # L'envoi initial de la prédiction, s'il est encore en cours, fournit le message_id
+        if send_future is not None:
+            send_future.result()
+        prediction_data = self.card_predictor.predictions.get(predicted_game)
+        message_id = prediction_data.message_id if prediction_data else None
+
+        if message_id:
+            self.edit_message(
+                chat_id=chat_id, 
+                text=new_message,
+                message_id=message_id
+            )
+        else:
+            self.send_message(chat_id=chat_id, text=new_message)
 
     # --- GESTION DES COMMANDES (/start, /stat, /bilan, /inter) ---
     def _handle_start_command(self, chat_id: int) -> None:
-        self.send_message(chat_id, WELCOME_MESSAGE)
+        if getattr(self._webhook, 'capture', False):
+            self.send_message(chat_id, WELCOME_MESSAGE, parse_mode='Markdown')
+            return
+        # Corps pré-sérialisé : seul le chat_id est ajouté
+        self._post_json('sendMessage', self._send_url, chat_id, b'{"chat_id":%d,' % chat_id + _WELCOME_BODY_TAIL)
     
     def _handle_stat_command(self, chat_id: int) -> None:
-        if not self.card_predictor: return
-        source_id = self.card_predictor.target_channel_id if self.card_predictor.target_channel_id else "❌ Non Configuré"
-        pred_id = self.card_predictor.prediction_channel_id if self.card_predictor.prediction_channel_id else "❌ Non Configuré"
+        cp = self.card_predictor
+        if not cp: return
+        source_id = cp.target_channel_id or "❌ Non Configuré"
+        pred_id = cp.prediction_channel_id or "❌ Non Configuré"
         
         text = (
             f"**📈 STATISTIQUES GLOBALES 📊**\n"
             f"Canal Source (Lecture): `{source_id}`\n"
             f"Canal Prédiction (Écriture): `{pred_id}`\n"
-            f"Mode Intelligent Actif: {'✅ OUI' if self.card_predictor.is_inter_mode_active else '❌ NON'}"
+            f"Mode Intelligent Actif: {'✅ OUI' if cp.is_inter_mode_active else '❌ NON'}"
         )
-        self.send_message(chat_id, text)
+        if hasattr(cp, 'get_counts'):
+            c = cp.get_counts()
+            text += (
+                f"\n\nRéussites (Dame Q): {c['correct']} "
+                f"(✅0️⃣ {c['correct_0']} / ✅1️⃣ {c['correct_1']} / ✅2️⃣ {c['correct_2']})\n"
+                f"Échecs: {c['failed']}"
+            )
+        self.send_message(chat_id, text, parse_mode='Markdown')
 
     def _handle_bilan_command(self, chat_id: int) -> None:
-        if not self.card_predictor: return
-        text = f"**📋 BILAN 🛎️**\nPrédictions stockées: {len(self.card_predictor.predictions) if hasattr(self.card_predictor, 'predictions') else 0}"
-        self.send_message(chat_id, text)
+        cp = self.card_predictor
+        if not cp: return
+        text = f"**📋 BILAN 🛎️**\nPrédictions stockées: {len(cp.predictions) if hasattr(cp, 'predictions') else 0}"
+        if hasattr(cp, 'get_counts'):
+            text += f"\nEn attente: {cp.get_counts()['pending']}"
+        self.send_message(chat_id, text, parse_mode='Markdown')
 
     def _handle_inter_command(self, chat_id: int) -> None:
         """Gère l'affichage du statut INTER et des boutons d'action."""
@@ -188,20 +450,16 @@ class TelegramHandlers:
         # Appel à la méthode mise à jour de CardPredictor
         message, keyboard = self.card_predictor.get_inter_status()
         
-        self.send_message(chat_id, message, reply_markup=keyboard)
+        self.send_message(chat_id, message, parse_mode='Markdown', reply_markup=keyboard)
         
     # --- GESTION DE LA CONFIGURATION DYNAMIQUE ---
 
     def _send_config_prompt(self, chat_id: int, chat_title: str) -> None:
         """Envoie le message de configuration avec les boutons au chat où le bot a été ajouté."""
-        keyboard = get_config_keyboard()
+        keyboard = _CONFIG_KEYBOARD_JSON
 
-        message = (
-            f"**🚨 Configuration du Canal 🚨**\n\n"
-            f"Le bot a été ajouté au chat **`{chat_title}`** (ID: `{chat_id}`).\n\n"
-            f"Veuillez confirmer le rôle de ce chat pour les prédictions Dame (Q):"
-        )
-        self.send_message(chat_id, message, reply_markup=keyboard)
+        message = _CONFIG_PROMPT.format(chat_title=chat_title, chat_id=chat_id)
+        self.send_message(chat_id, message, parse_mode='Markdown', reply_markup=keyboard)
 
 
     def _handle_callback_query(self, callback_query: Dict[str, Any]) -> None:
@@ -212,78 +470,71 @@ class TelegramHandlers:
         chat_title = callback_query['message']['chat'].get('title', f'Chat ID: {chat_id}')
         callback_id = callback_query['id'] 
 
+        def answer(text: str) -> None:
+            # Notification non critique : envoyée sans attendre, sans passer derrière les envois du chat
+            self._background.submit(self._answer_callback, callback_id, text)
+
         if not self.card_predictor:
             self.edit_message(chat_id, message_id, "⚠️ Erreur: Système de prédiction non initialisé.")
-            self._answer_callback(callback_id, "Erreur système.")
+            answer("Erreur système.")
             return
 
-        message = ""
-        action_success = False
-
-        # --- GESTION DES BOUTONS DE CONFIGURATION INITIALE ---
-        if data == CALLBACK_SOURCE:
-            self.card_predictor.set_channel_id(chat_id, 'source')
-            message = (
-                f"**🟢 CONFIGURATION RÉUSSIE : CANAL SOURCE**\n"
-                f"Ce chat (`{chat_title}`) est maintenant le canal où le bot **LIRE** les jeux (ID: `{chat_id}`)."
-            )
-            action_success = True
-        elif data == CALLBACK_PREDICTION:
-            self.card_predictor.set_channel_id(chat_id, 'prediction')
-            message = (
-                f"**🔵 CONFIGURATION RÉUSSIE : CANAL DE PRÉDICTION**\n"
-                f"Ce chat (`{chat_title}`) est maintenant le canal où le bot **ÉCRIRA** ses prédictions (ID: `{chat_id}`)."
-            )
-            action_success = True
-        elif data == CALLBACK_CANCEL:
-            message = f"**❌ CONFIGURATION ANNULÉE.** Le chat `{chat_title}` n'a pas été configuré."
-            action_success = True
-
-        # --- GESTION DES BOUTONS INTER ---
-        elif data == CALLBACK_INTER_APPLY:
-            # Re-analyse l'historique et définit les nouvelles règles
-            self.card_predictor.analyze_and_set_smart_rules(initial_load=False)
-            status_text, _ = self.card_predictor.get_inter_status() # Récupère le nouveau statut sans les boutons
-            
-            message = (
-                f"**✅ RÈGLES INTELLIGENTES APPLIQUÉES!**\n\n"
-                f"Le bot va maintenant prédire "
-                f"en utilisant le TOP 3 des déclencheurs trouvés dans l'historique."
-            )
-            message += "\n\n---\n" + status_text
-            self._answer_callback(callback_id, "Règles appliquées.")
-            action_success = True
-
-
-        elif data == CALLBACK_INTER_DEFAULT:
-            # Désactive le mode intelligent
-            self.card_predictor.is_inter_mode_active = False
-            # Sauvegarde uniquement le statut (les règles restent en mémoire mais sont ignorées)
-            self.card_predictor._save_data(self.card_predictor.is_inter_mode_active, 'inter_mode_status.json')
-            
-            message = "**❌ RÈGLE PAR DÉFAUT APPLIQUÉE!**\n\nLe bot utilise uniquement la logique statique (ex: Valets J) pour la prédiction."
-            self._answer_callback(callback_id, "Mode Défaut activé.")
-            action_success = True
-            
-        else:
-            self._answer_callback(callback_id, "Action inconnue.")
+        handler = self._callbacks.get(data)
+        if handler is None:
+            answer("Action inconnue.")
             return
-        
-        # Édite le message de configuration/commande pour afficher le résultat final (retire les boutons si l'action est complète)
-        if action_success:
-             self.edit_message(chat_id, message_id, message) 
-             if data not in (CALLBACK_INTER_APPLY, CALLBACK_INTER_DEFAULT): # Pour les configurations de canal
-                 self._answer_callback(callback_id, "Configuration terminée!")
+        message, notification = handler(chat_id, chat_title)
+
+        # Édite le message de configuration/commande pour afficher le résultat final (retire les boutons)
+        self.edit_message(chat_id, message_id, message, parse_mode='Markdown')
+        answer(notification)
+
+    # --- ACTIONS DES BOUTONS : (texte du message édité, notification) ---
+    def _callback_source(self, chat_id: int, chat_title: str) -> Tuple[str, str]:
+        self.card_predictor.set_channel_id(chat_id, 'source')
+        return (
+            f"**🟢 CONFIGURATION RÉUSSIE : CANAL SOURCE**\n"
+            f"Ce chat (`{chat_title}`) est maintenant le canal où le bot **LIRE** les jeux (ID: `{chat_id}`)."
+        ), "Configuration terminée!"
+
+    def _callback_prediction(self, chat_id: int, chat_title: str) -> Tuple[str, str]:
+        self.card_predictor.set_channel_id(chat_id, 'prediction')
+        return (
+            f"**🔵 CONFIGURATION RÉUSSIE : CANAL DE PRÉDICTION**\n"
+            f"Ce chat (`{chat_title}`) est maintenant le canal où le bot **ÉCRIRA** ses prédictions (ID: `{chat_id}`)."
+        ), "Configuration terminée!"
+
+    def _callback_cancel(self, chat_id: int, chat_title: str) -> Tuple[str, str]:
+        return f"**❌ CONFIGURATION ANNULÉE.** Le chat `{chat_title}` n'a pas été configuré.", "Configuration terminée!"
+
+    def _callback_inter_apply(self, chat_id: int, chat_title: str) -> Tuple[str, str]:
+        # Re-analyse l'historique et définit les nouvelles règles
+        self.card_predictor.analyze_and_set_smart_rules(initial_load=False)
+        status_text, _ = self.card_predictor.get_inter_status() # Récupère le nouveau statut sans les boutons
+        message = (
+            f"**✅ RÈGLES INTELLIGENTES APPLIQUÉES!**\n\n"
+            f"Le bot va maintenant prédire "
+            f"en utilisant le TOP 3 des déclencheurs trouvés dans l'historique."
+        )
+        return message + "\n\n---\n" + status_text, "Règles appliquées."
+
+    def _callback_inter_default(self, chat_id: int, chat_title: str) -> Tuple[str, str]:
+        # Désactive le mode intelligent
+        self.card_predictor.is_inter_mode_active = False
+        # Sauvegarde uniquement le statut (les règles restent en mémoire mais sont ignorées)
+        self.card_predictor._save_data(self.card_predictor.is_inter_mode_active, 'inter_mode_status.json')
+        return (
+            "**❌ RÈGLE PAR DÉFAUT APPLIQUÉE!**\n\nLe bot utilise uniquement la logique statique (ex: Valets J) pour la prédiction."
+        ), "Mode Défaut activé."
 
 
     def _answer_callback(self, callback_id: str, text: str):
         """Répond à une callback query pour afficher une notification."""
-        url = f"{self.base_url}/answerCallbackQuery"
         payload = {'callback_query_id': callback_id, 'text': text}
         try:
-            requests.post(url, json=payload)
+            self.session.post(self._answer_url, data=_dumps(payload), headers=_JSON_HEADERS, timeout=HTTP_TIMEOUT)
         except requests.exceptions.RequestException as e:
-            logger.error(f"Erreur answerCallbackQuery: {e}")
+            logger.error("Erreur answerCallbackQuery: %s", e)
 
     # --- GESTION DES UPDATES PRINCIPALES ---
     
@@ -292,18 +543,33 @@ class TelegramHandlers:
         try:
             chat_id = message['chat']['id']
             if 'text' in message:
+                # Sortie immédiate : ni commande ni canal source (discussions de groupe, autres canaux)
+                is_source = self.card_predictor is not None and chat_id == self.card_predictor.target_channel_id
                 text = message['text'].strip()
-                if text.startswith('/'):
-                    if text == '/start': self._handle_start_command(chat_id)
-                    elif text == '/stat': self._handle_stat_command(chat_id)
-                    elif text == '/bilan': self._handle_bilan_command(chat_id)
-                    elif text.startswith('/inter'): self._handle_inter_command(chat_id)
+                is_command = text[:1] == '/'
+                if not is_source and not is_command:
+                    return
+
+                if is_command:
+                    user_id = message.get('from', {}).get('id', chat_id)
+                    if is_rate_limited(user_id):
+                        logger.warning("⏳ Limite de débit atteinte pour %s, commande ignorée.", user_id)
+                        return
+                    command = text.split(None, 1)[0].split('@', 1)[0].lower()
+                    handler = self._commands.get(command)
+                    if handler:
+                        if getattr(self._webhook, 'capture', False):
+                            # Webhook : la réponse part dans le corps de la réponse HTTP, sans appel à Telegram
+                            handler(chat_id)
+                        else:
+                            # Réponse envoyée depuis le thread du chat : on rend la main sans attendre Telegram
+                            self._submit_to_chat(chat_id, handler, chat_id)
                     return 
 
-                if self.card_predictor and chat_id == self.card_predictor.target_channel_id: 
+                if is_source: 
                     self._process_channel_message(message)
         except Exception as e:
-            logger.error(f"❌ Erreur de traitement du message: {e}")
+            logger.error("❌ Erreur de traitement du message: %s", e, exc_info=True)
 
     def _handle_edited_message(self, message: Dict[str, Any]) -> None:
         # Logique pour gérer les messages édités du canal source
@@ -312,21 +578,26 @@ class TelegramHandlers:
             if self.card_predictor and chat_id == self.card_predictor.target_channel_id:
                 self._process_channel_message(message, is_edited=True)
         except Exception as e:
-            logger.error(f"❌ Erreur de traitement du message édité: {e}")
+            logger.error("❌ Erreur de traitement du message édité: %s", e, exc_info=True)
 
     def _process_channel_message(self, message: Dict[str, Any], is_edited: bool = False) -> None:
         # Logique unifiée de prédiction et de vérification pour les messages de canal (dépend de CardPredictor)
         if not self.card_predictor: return
         message_text = message.get('text', '')
-        if not message_text: return
+        # Rejet rapide par recherche de sous-chaîne (sans '#' ni '🔵', aucun numéro de jeu possible), puis motif exact
+        if '#' not in message_text and '🔵' not in message_text: return
+        if not _RELEVANT_RE.search(message_text): return
         
+        # Analyse unique du message, partagée par la vérification et la prédiction
+        parsed = self.card_predictor.parse_message(message_text)
+
         # 1. Vérification des prédictions passées
-        verification_action = self.card_predictor._verify_prediction_common(message_text, is_edited=is_edited)
+        verification_action = self.card_predictor._verify_prediction_common(message_text, is_edited=is_edited, parsed=parsed)
         if verification_action:
             self.process_prediction_action(verification_action)
             
         # 2. Déclenchement de la nouvelle prédiction (inclut la collecte INTER)
-        should_predict, game_number, predicted_value = self.card_predictor.should_predict(message_text)
+        should_predict, game_number, predicted_value = self.card_predictor.should_predict(message_text, parsed)
         if should_predict:
             new_prediction_message = self.card_predictor.make_prediction(game_number, predicted_value)
             action = {
@@ -337,8 +608,13 @@ class TelegramHandlers:
             self.process_prediction_action(action)
 
 
-    def handle_update(self, update: Dict[str, Any]) -> None:
-        """Point d'entrée principal pour traiter une mise à jour Telegram."""
+    def handle_update(self, update: Dict[str, Any], webhook_reply: bool = False) -> Optional[Dict]:
+        """
+        Point d'entrée principal pour traiter une mise à jour Telegram.
+        Avec webhook_reply, renvoie la réponse à une commande (méthode Bot API) à écrire dans la réponse du webhook.
+        """
+        self._webhook.capture = webhook_reply
+        self._webhook.reply = None
         try:
             # 1. GESTION DES CALLBACKS (Boutons)
             if 'callback_query' in update:
@@ -350,26 +626,28 @@ class TelegramHandlers:
                 # Vérifie si le statut change pour le bot lui-même
                 if my_chat_member['new_chat_member']['status'] in ['member', 'administrator']:
                     # Pour être sûr que c'est bien notre bot et non un autre
-                    bot_id = int(self.bot_token.split(':')[0])
-                    if my_chat_member['new_chat_member']['user']['id'] == bot_id:
+                    if my_chat_member['new_chat_member']['user']['id'] == self.bot_id:
                         chat_id = my_chat_member['chat']['id']
                         chat_title = my_chat_member['chat'].get('title', f'Chat ID: {chat_id}')
                         chat_type = my_chat_member['chat'].get('type', 'private')
                         
                         # Déclenche le prompt de configuration si c'est un groupe ou un canal
                         if chat_type in ['channel', 'group', 'supergroup']:
-                            logger.info(f"✨ BOT AJOUTÉ/PROMU : Envoi du prompt de configuration à {chat_title} ({chat_id})")
-                            self._send_config_prompt(chat_id, chat_title)
+                            logger.info("✨ BOT AJOUTÉ/PROMU : Envoi du prompt de configuration à %s (%s)", chat_title, chat_id)
+                            self._submit_to_chat(chat_id, self._send_config_prompt, chat_id, chat_title)
             
-            # 3. GESTION DES MESSAGES/POSTS
-            elif 'message' in update:
-                self._handle_message(update['message'])
-            elif 'edited_message' in update:
-                self._handle_edited_message(update['edited_message'])
-            elif 'channel_post' in update:
-                self._handle_message(update['channel_post'])
-            elif 'edited_channel_post' in update:
-                self._handle_edited_message(update['edited_channel_post'])
+            # 3. GESTION DES MESSAGES/POSTS (une seule recherche de clé par update)
+            else:
+                for key, handler_name in _MESSAGE_KEYS:
+                    message = update.get(key)
+                    if message is not None:
+                        getattr(self, handler_name)(message)
+                        break
 
         except Exception as e:
-            logger.error(f"❌ Erreur critique lors du traitement de l'update: {e}")
+            logger.error("❌ Erreur critique lors du traitement de l'update: %s", e, exc_info=True)
+
+        reply = self._webhook.reply
+        self._webhook.capture = False
+        self._webhook.reply = None
+        return reply
@@ -5,14 +5,34 @@ Main entry point for the Telegram bot deployment on render.com
 """
 import os
 import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from flask import Flask, request, jsonify
-import requests
+
+# orjson pour le JSON de Flask (corps des webhooks et réponses jsonify), sinon json standard de Flask
+try:
+    import orjson
+    from flask.json.provider import JSONProvider
+
+    class OrjsonProvider(JSONProvider):
+        """Fournisseur JSON Flask basé sur orjson (analyse et sérialisation en C)."""
+
+        def dumps(self, obj, **kwargs) -> str:
+            return orjson.dumps(obj).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+except ImportError:
+    OrjsonProvider = None
 
 # Importe la configuration et le bot
 from config import Config
 from bot import TelegramBot 
 
 # Configure logging
+# Métadonnées de thread/processus inutilisées par le format : non collectées pour chaque enregistrement
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -23,7 +43,7 @@ logger = logging.getLogger(__name__)
 try:
     config = Config()
 except ValueError as e:
-    logger.error(f"❌ Erreur d'initialisation de la configuration: {e}")
+    logger.error("❌ Erreur d'initialisation de la configuration: %s", e)
     exit(1) 
 
 # 'bot' est l'instance de la classe TelegramBot
@@ -31,36 +51,72 @@ bot = TelegramBot(config.BOT_TOKEN)
 
 # Initialize Flask app
 app = Flask(__name__)
+if OrjsonProvider is not None:
+    app.json = OrjsonProvider(app)
 
 
 # --- LOGIQUE WEBHOOK ---
 
+# Réponses JSON fixes, encodées une seule fois
+_JSON_HEADERS = {'Content-Type': 'application/json'}
+_EMPTY_UPDATE_BODY = b'{"status":"ok"}'
+_HEALTH_BODY = b'{"status":"healthy","service":"telegram-bot"}'
+_HOME_BODY = b'{"message":"Telegram Bot is running","status":"active"}'
+# Attente maximale (secondes) de la réponse d'une commande avant de répondre au webhook sans elle
+WEBHOOK_REPLY_TIMEOUT = 5
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Handle incoming webhook from Telegram"""
     try:
         update = request.get_json(silent=True)
         if not update:
-            return jsonify({'status': 'ok'}), 200
-
-        # Délégation du traitement complet à bot.handle_update
-        if update:
-            bot.handle_update(update)
+            return _EMPTY_UPDATE_BODY, 200, _JSON_HEADERS
+
+        if not bot.needs_webhook_reply(update):
+            # Accusé immédiat : traitement par le thread du bot (posts de canal, boutons, adhésions)
+            if bot.submit_update(update, block=False):
+                return b'OK', 200
+            # File pleine : Telegram renverra l'update plus tard
+            logger.warning("⚠️ File des updates pleine, update refusé (503)")
+            return b'Busy', 503
+
+        # Commande : traitée elle aussi par le thread du bot (seul à modifier l'état du prédicteur) ;
+        # sa réponse est renvoyée directement à Telegram dans le corps de la réponse du webhook
+        reply_future = Future()
+        if not bot.submit_update(update, block=False, reply=reply_future):
+            logger.warning("⚠️ File des updates pleine, commande refusée (503)")
+            return b'Busy', 503
+        try:
+            reply = reply_future.result(timeout=WEBHOOK_REPLY_TIMEOUT)
+        except FutureTimeout:
+            # Pas encore commencée : annulée ici, elle répondra par l'API
+            if reply_future.cancel():
+                return b'OK', 200
+            # Déjà en cours : seconde attente bornée (le worker gunicorn unique n'est jamais bloqué),
+            # puis réponse par l'API à la fin du traitement
+            try:
+                reply = reply_future.result(timeout=WEBHOOK_REPLY_TIMEOUT)
+            except FutureTimeout:
+                bot.send_reply_when_done(reply_future)
+                return b'OK', 200
+        if reply:
+            return jsonify(reply), 200
         
-        return 'OK', 200
+        return b'OK', 200
     except Exception as e:
-        logger.error(f"Error handling webhook: {e}")
+        logger.error("Error handling webhook: %s", e, exc_info=True)
         return 'Error', 500
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint for render.com"""
-    return {'status': 'healthy', 'service': 'telegram-bot'}, 200
+    return _HEALTH_BODY, 200, _JSON_HEADERS
 
 @app.route('/', methods=['GET'])
 def home():
     """Root endpoint"""
-    return {'message': 'Telegram Bot is running', 'status': 'active'}, 200
+    return _HOME_BODY, 200, _JSON_HEADERS
 
 # --- CONFIGURATION WEBHOOK ---
 
@@ -70,19 +126,19 @@ def setup_webhook():
         full_webhook_url = config.get_webhook_url()
         
         if full_webhook_url and not config.WEBHOOK_URL.startswith('https://.repl.co'):
-            logger.info(f"🔗 Tentative de configuration webhook: {full_webhook_url}")
+            logger.info("🔗 Tentative de configuration webhook: %s", full_webhook_url)
 
             success = bot.set_webhook(full_webhook_url)
             
             if success:
-                logger.info(f"✅ Webhook configuré avec succès.")
-                logger.info(f"🎯 Bot prêt pour prédictions automatiques et vérifications via webhook")
+                logger.info("✅ Webhook configuré avec succès.")
+                logger.info("🎯 Bot prêt pour prédictions automatiques et vérifications via webhook")
             else:
                 logger.error("❌ Échec configuration webhook.")
         else:
             logger.warning("⚠️ WEBHOOK_URL non configurée ou non valide. Le webhook ne sera PAS configuré.")
     except Exception as e:
-        logger.error(f"❌ Erreur critique lors du setup du webhook: {e}")
+        logger.error("❌ Erreur critique lors du setup du webhook: %s", e)
 
 if __name__ == '__main__':
     # Set up webhook on startup
@@ -1,29 +1,67 @@
 """
 Point d'entrée pour Render.com - MODE POLLING PUR
-Le bot fonctionne sans Flask/Webhook
+Le bot fonctionne sans Webhook (le serveur Flask de main.py n'est pas démarré)
 """
 
 import os
+import sys
+from typing import Optional
+import signal
 import logging
 import time
-from config import Config
-from bot import TelegramBot
-from handlers import process_update
-
-logging.basicConfig(
-    level=logging.INFO, 
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+# Initialisation commune avec le mode webhook : logging, Config validée et instance unique du bot
+from main import config, bot
+
 logger = logging.getLogger(__name__)
 
-# --- Initialisation ---
-config = Config()
+# Durée du long polling getUpdates (secondes, maximum accepté par Telegram) : pas de pause entre deux appels
+POLL_TIMEOUT = 50
+# Attente maximale (secondes) entre deux tentatives après des erreurs réseau successives
+POLL_BACKOFF_MAX = 60
+
+
+def _retry_after(response) -> Optional[int]:
+    """Délai imposé par Telegram (429 : parameters.retry_after, sinon en-tête Retry-After), None s'il est absent."""
+    try:
+        retry_after = response.json().get('parameters', {}).get('retry_after')
+        return retry_after or int(response.headers['Retry-After'])
+    except (ValueError, AttributeError, KeyError, TypeError):
+        return None
+
+
+def _backoff(failures: int) -> float:
+    """Attente exponentielle plafonnée, avec gigue (les reprises ne tombent pas toutes au même instant)."""
+    return min(POLL_BACKOFF_MAX, 2 ** failures) + random.random()
 
-if not config.BOT_TOKEN:
-    logger.critical("❌ FATAL - BOT_TOKEN n'est pas configuré")
-    exit(1)
+class _HealthHandler(BaseHTTPRequestHandler):
+    """Répond 200 OK à toute requête GET/HEAD (health check Render)."""
 
-bot = TelegramBot(config.BOT_TOKEN)
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        if self.command == 'GET':
+            self.wfile.write(b'OK')
+
+    do_HEAD = do_GET
+
+    def log_message(self, format, *args):
+        # Pas de ligne de log par sonde
+        pass
+
+
+def _health_server():
+    """Serveur HTTP minimal sur $PORT : le health check passe pendant delete_webhook et les attentes de reconnexion."""
+    try:
+        ThreadingHTTPServer(('0.0.0.0', config.PORT), _HealthHandler).serve_forever()
+    except OSError as e:
+        logger.error("❌ Serveur de santé indisponible sur le port %s: %s", config.PORT, e)
 
 # --- Fonction de Polling ---
 def start_polling():
@@ -31,11 +69,11 @@ def start_polling():
     logger.info("=" * 60)
     logger.info("🤖 BOT TELEGRAM DAME PRÉDICTION - MODE POLLING")
     logger.info("=" * 60)
-    logger.info(f"✅ Bot Token configuré")
-    logger.info(f"✅ Admin Chat ID: {config.ADMIN_CHAT_ID}")
-    logger.info(f"✅ Canal Source: {config.TARGET_CHANNEL_ID}")
-    logger.info(f"✅ Canal Prédiction: {config.PREDICTION_CHANNEL_ID}")
-    logger.info(f"✅ Environnement: {'RENDER.COM' if config.IS_RENDER else 'AUTRE'}")
+    logger.info("✅ Bot Token configuré")
+    logger.info("✅ Admin Chat ID: %s", config.ADMIN_CHAT_ID)
+    logger.info("✅ Canal Source: %s", config.TARGET_CHANNEL_ID)
+    logger.info("✅ Canal Prédiction: %s", config.PREDICTION_CHANNEL_ID)
+    logger.info("✅ Environnement: %s", 'RENDER.COM' if os.getenv('RENDER') else 'AUTRE')
     logger.info("=" * 60)
     
     # Supprimer le webhook s'il existe
@@ -44,25 +82,45 @@ def start_polling():
     time.sleep(1)
     
     offset = 0
+    failures = 0
     logger.info("🚀 Démarrage du polling...")
     
     while True:
         try:
-            updates = bot.get_updates(offset=offset, timeout=30)
-            
-            if updates:
-                for update in updates:
-                    try:
-                        process_update(bot, update)
-                        offset = update['update_id'] + 1
-                    except Exception as e:
-                        logger.error(f"❌ Erreur traitement update: {e}")
-                        import traceback
-                        logger.error(traceback.format_exc())
-            
+            updates = bot.get_updates(offset=offset, timeout=POLL_TIMEOUT)
+        except requests.exceptions.HTTPError as e:
+            # Erreur renvoyée par Telegram : respecter retry_after s'il est fourni (429)
+            failures += 1
+            delay = _retry_after(e.response) or _backoff(failures)
+            logger.warning("⚠️ Erreur API getUpdates (%s), nouvelle tentative dans %.1fs", e, delay)
+            time.sleep(delay)
+            continue
+        except requests.exceptions.RequestException as e:
+            # Erreur réseau transitoire : attente exponentielle plafonnée
+            failures += 1
+            delay = _backoff(failures)
+            logger.warning("⚠️ Erreur réseau polling (%s), nouvelle tentative dans %.1fs", e, delay)
+            time.sleep(delay)
+            continue
         except Exception as e:
-            logger.error(f"❌ Erreur polling: {e}")
-            time.sleep(5)
+            # Erreur de programmation : journalisée avec la trace, courte pause contre une boucle serrée
+            logger.exception("❌ Erreur polling: %s", e)
+            time.sleep(1)
+            continue
+        failures = 0
+
+        if updates:
+            # Le lot entier est acquitté au prochain getUpdates, même si un update échoue (pas de boucle de rejeu)
+            offset = updates[-1]['update_id'] + 1
+            # Remis au thread de traitement du bot (file bornée : attend si elle est pleine) ;
+            # le getUpdates suivant part sans attendre le traitement
+            for update in updates:
+                bot.submit_update(update)
 
 if __name__ == '__main__':
+    # Arrêt demandé par Render (SIGTERM) : sortie normale pour que les sauvegardes atexit
+    # (écritures groupées de CardPredictor) soient faites
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # Port ouvert avant le premier appel réseau pour que Render considère le service démarré
+    threading.Thread(target=_health_server, name="health", daemon=True).start()
     start_polling()
@@ -0,0 +1,36 @@
+"""Tests de CardPredictor.verify (card_predictor677)."""
+import pytest
+
+from card_predictor677 import CardPredictor
+
+
+@pytest.fixture
+def predictor(tmp_path, monkeypatch):
+    # Fichiers de persistance créés dans un répertoire temporaire
+    monkeypatch.chdir(tmp_path)
+    predictor = CardPredictor()
+    yield predictor
+    # Écritures en attente faites ici et de façon synchrone (le thread d'écriture utilise des chemins
+    # relatifs), pas par atexit hors du répertoire temporaire
+    predictor._flush_on_exit()
+
+
+def test_verify_success_with_queen(predictor):
+    predictor.make_prediction(100, 'Q', '')  # prédiction pour le jeu 102
+
+    action = predictor.verify("#N103. 12(Q♠️5♥️) - 8(3♦️5♣️) ✅")
+
+    assert action['type'] == 'edit_message'
+    assert action['predicted_game'] == 102
+    assert action['new_message'] == "🔵102🔵:Valeur Q statut :✅1️⃣"
+    assert 102 not in predictor.predictions
+
+
+def test_verify_failure_at_offset_2(predictor):
+    predictor.make_prediction(100, 'Q', '')
+
+    assert predictor.verify("#N102. 12(7♠️5♥️) - 8(3♦️5♣️) ✅") is None
+    action = predictor.verify("#N104. 12(7♠️5♥️) - 8(3♦️5♣️) ✅")
+
+    assert action['new_message'] == "🔵102🔵:Valeur Q statut :❌"
+    assert 102 not in predictor.predictions